@@ -1,67 +1,185 @@
-from .models import (TaskIn, TaskOut, TaskInUpdate, TaskStatusModel)
+from .models import (TaskIn, TaskInUpdate, TaskStatusModel)
+from .persistence import TaskLog
 from fastapi import HTTPException
+import threading
 import uuid
 
+class TaskRecord:
+    '''A stored task, much smaller than the TaskOut built from it for responses.
+
+    Records are never changed in place, a write stores a new one, so readers
+    can keep using the ones they got without locks.
+    '''
+    __slots__ = ('task_id', 'name', 'description', 'status')
+
+    def __init__(self, task_id, name, description, status):
+        self.task_id = task_id
+        self.name = name
+        self.description = description
+        self.status = status
+
+    def __eq__(self, other):
+        if not isinstance(other, TaskRecord):
+            return NotImplemented
+        return (
+            self.task_id == other.task_id
+            and self.name == other.name
+            and self.description == other.description
+            and self.status == other.status
+        )
+
+    def __repr__(self):
+        return (
+            f'TaskRecord(task_id={self.task_id!r}, name={self.name!r}, '
+            f'description={self.description!r}, status={self.status!r})'
+        )
+
 class DBSession:
     fake_db = {}
+    # Ids of the tasks in fake_db by status, kept up to date on every write so
+    # filtered reads only touch the tasks they return. Dicts with no values
+    # are used as sets that keep insertion order.
+    status_index = {True: {}, False: {}}
+    # Write-ahead log of every write, when persistence is on (see open_log)
+    log = None
+    # Writes to a task hold the lock of its stripe, so concurrent writes to
+    # different tasks do not wait on each other. Reads take no lock: they
+    # work on copies of the dicts, which CPython makes atomically.
+    stripes = [threading.Lock() for _ in range(64)]
 
     def __init__(self):
         self.fake_db = DBSession.fake_db
+        self.status_index = DBSession.status_index
+        self.log = DBSession.log
+        self.stripes = DBSession.stripes
+
+    def stripe(self, task_id):
+        return self.stripes[task_id.int % len(self.stripes)]
 
     def create_task(self, task):
 
         id = uuid.uuid4()
 
-        task_out_db = TaskOut(**task.dict(), status=False, task_id=id)
-        self.fake_db.update({id: task_out_db})
+        task_out_db = TaskRecord(id, task.name, task.description, False)
+        with self.stripe(id):
+            self.fake_db.update({id: task_out_db})
+            self.status_index[task_out_db.status][id] = None
+            self.log_put(task_out_db)
+        self.snapshot_if_needed()
 
         return task_out_db
 
     def read_task(self, q = None):
 
-        q_dict = {}
-
         if q != None:
-            for task in self.fake_db.values():
-
-                if task.status and q == TaskStatusModel.done:
-                    q_dict.update({task.task_id: task})
-
-                elif not task.status and q == TaskStatusModel.not_done:
-                    q_dict.update({task.task_id: task})
-
-            return q_dict
+            status = q == TaskStatusModel.done
+            tasks = {}
+            # A task may be deleted or change status after the ids are copied
+            for task_id in list(self.status_index[status]):
+                task = self.fake_db.get(task_id)
+                if task is not None and task.status == status:
+                    tasks[task_id] = task
+            return tasks
         else:
-            return self.fake_db
+            return dict(self.fake_db)
 
     def update_task(self, task_id, task):
 
-        if task_id not in self.fake_db:
-            raise HTTPException(
-                status_code=404,
-                detail='Task not found',
-            )
+        with self.stripe(task_id):
+            if task_id not in self.fake_db:
+                raise HTTPException(
+                    status_code=404,
+                    detail='Task not found',
+                )
 
-        task_db = self.fake_db.get(task_id)
-        update_data = task_db.dict(exclude_unset=True)
-        update_data.update(**task.dict())
-        task_out = TaskOut(**update_data)
-        self.fake_db.update({task_id: task_out})
+            task_db = self.fake_db.get(task_id)
+            task_out = TaskRecord(task_id, task_db.name, task.description, task.status)
+            status_changed = task_out.status != task_db.status
+            if status_changed:
+                self.status_index[task_out.status][task_id] = None
+            self.fake_db.update({task_id: task_out})
+            if status_changed:
+                del self.status_index[task_db.status][task_id]
+            self.log_put(task_out)
+        self.snapshot_if_needed()
 
         return task_out
 
     def delete_task(self, task_id):
-        try:
-            task_db = self.fake_db.get(task_id)
-            del self.fake_db[task_id]
-
-        except KeyError as exception:
-            raise HTTPException(
-                status_code=404,
-                detail='Task not found',
-            ) from exception
-
-        return self.fake_db
+        with self.stripe(task_id):
+            try:
+                task_db = self.fake_db.get(task_id)
+                del self.fake_db[task_id]
+                del self.status_index[task_db.status][task_id]
+
+            except KeyError as exception:
+                raise HTTPException(
+                    status_code=404,
+                    detail='Task not found',
+                ) from exception
+
+            if self.log is not None:
+                self.log.delete(task_id)
+        self.snapshot_if_needed()
+
+        return task_db
+
+    def delete_tasks(self, task_ids):
+        '''Deletes the tasks with `task_ids` that exist and returns their ids.'''
+        deleted = []
+        for task_id in task_ids:
+            with self.stripe(task_id):
+                task_db = self.fake_db.pop(task_id, None)
+                if task_db is None:
+                    continue
+                del self.status_index[task_db.status][task_id]
+                if self.log is not None:
+                    self.log.delete(task_id)
+            deleted.append(task_id)
+        self.snapshot_if_needed()
+
+        return deleted
+
+    def log_put(self, task):
+        if self.log is not None:
+            self.log.put(task.task_id, task.name, task.description, task.status)
+
+    def snapshot_if_needed(self):
+        # Written by the log's background thread, not by this request
+        if self.log is not None and self.log.needs_snapshot():
+            self.log.request_snapshot(self.snapshot_records)
+
+    def snapshot_records(self):
+        # Only copied once TaskLog.snapshot has moved new writes to a new log
+        for task in list(self.fake_db.values()):
+            yield task.task_id, task.name, task.description, task.status
+
+def load_tasks(tasks):
+    '''Replaces the tasks in the store with `tasks`.'''
+    DBSession.fake_db.clear()
+    for status_ids in DBSession.status_index.values():
+        status_ids.clear()
+    for task in tasks:
+        DBSession.fake_db[task.task_id] = task
+        DBSession.status_index[task.status][task.task_id] = None
+
+def open_log(directory, **options):
+    '''Loads the store from `directory` and logs every later write there.
+
+    See TaskLog for the options.
+    '''
+    log = TaskLog(directory, **options)
+    tasks = log.load()
+    load_tasks(
+        TaskRecord(task_id, fields['name'], fields['description'], fields['status'])
+        for task_id, fields in tasks.items()
+    )
+    DBSession.log = log
+
+def close_log():
+    if DBSession.log is not None:
+        DBSession.log.close()
+        DBSession.log = None
 
 def get_db():
     return DBSession()
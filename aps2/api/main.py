@@ -1,4 +1,6 @@
+import os
 from fastapi import FastAPI
+from .database import open_log, close_log
 from .routers import task
 
 app = FastAPI(
@@ -9,4 +11,16 @@ app.include_router(
     task.router,
     prefix='/task',
     tags=['task']
-)
\ No newline at end of file
+)
+
+# Persistence is off unless a data directory is given
+@app.on_event("startup")
+def startup():
+    data_dir = os.environ.get("APS2_DATA_DIR")
+    if data_dir:
+        open_log(data_dir)
+
+
+@app.on_event("shutdown")
+def shutdown():
+    close_log()
@@ -26,6 +26,10 @@ class TaskOut(BaseModel):
         example="True, False"
     )
 
+    class Config:
+        # Built from the store's TaskRecord when sending responses
+        orm_mode = True
+
 
 class TaskInUpdate(BaseModel):
     description: str = Field(
@@ -39,4 +43,10 @@ class TaskInUpdate(BaseModel):
 
 class TaskStatusModel(str, Enum):
     done = "done"
-    not_done = "not_done"
\ No newline at end of file
+    not_done = "not_done"
+
+
+class TaskDeleteReturnModel(str, Enum):
+    tasks = "tasks"
+    id = "id"
+    none = "none"
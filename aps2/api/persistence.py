@@ -0,0 +1,220 @@
+import json
+import mmap
+import os
+import threading
+import uuid
+
+
+class TaskLog:
+    '''Write-ahead log plus snapshot of the task store, kept in `directory`.
+
+    Every write is appended to the log as one JSON line and handed to the OS
+    right away, but only fsynced every `fsync_interval` seconds or
+    `fsync_batch` records, so a crash of the machine (not of the process)
+    may lose the writes of that last interval.
+    Once the log holds `snapshot_every` records the store should be written
+    to a new snapshot, which also drops the older logs: `request_snapshot`
+    has it written by the background thread, `snapshot` writes it right away.
+    Writers never wait for an fsync or a snapshot.
+    '''
+
+    def __init__(self, directory, fsync_interval=1.0, fsync_batch=1000, snapshot_every=100000):
+        self.directory = directory
+        self.fsync_interval = fsync_interval
+        self.fsync_batch = fsync_batch
+        self.snapshot_every = snapshot_every
+        self.generation = 0
+        self.records = 0
+        self._pending = 0
+        self._log = None
+        self._lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._wake = threading.Event()
+        self._snapshot_tasks = None
+        self._background = None
+
+    def load(self):
+        '''Replays the snapshot and the logs after it and opens the log for writes.
+
+        Returns the stored tasks as {task_id: {name, description, status}}.
+        '''
+        os.makedirs(self.directory, exist_ok=True)
+        tasks = {}
+        snapshot_path = self._snapshot_path()
+        if os.path.exists(snapshot_path):
+            self.generation, _, _ = _replay(snapshot_path, tasks)
+
+        log_end = 0
+        for generation in self._log_generations():
+            if generation < self.generation:
+                # Left behind by a snapshot interrupted before the cleanup.
+                os.remove(self._log_path(generation))
+                continue
+            self.generation = generation
+            _, self.records, log_end = _replay(self._log_path(generation), tasks)
+
+        self._log = open(self._log_path(self.generation), 'ab')
+        # Drop a record torn by a crash, so new records start on a new line.
+        self._log.truncate(log_end)
+        self._background = threading.Thread(target=self._run_background, daemon=True)
+        self._background.start()
+        return tasks
+
+    def put(self, task_id, name, description, status):
+        self._append(['p', task_id.hex, name, description, status])
+
+    def delete(self, task_id):
+        self._append(['d', task_id.hex])
+
+    def needs_snapshot(self):
+        return self._snapshot_tasks is None and self.records >= self.snapshot_every
+
+    def request_snapshot(self, tasks):
+        '''Has the background thread write `tasks()` as the new snapshot.
+
+        `tasks` is called, and what it returns read, as `snapshot` reads its
+        argument. Ignored while an earlier snapshot is still pending.
+        '''
+        with self._lock:
+            if self._snapshot_tasks is not None:
+                return
+            self._snapshot_tasks = tasks
+        self._wake.set()
+
+    def snapshot(self, tasks):
+        '''Writes `tasks`, (task_id, name, description, status) tuples, as the new snapshot.
+
+        Writes made while the snapshot is taken go to a new log, which is
+        replayed on top of it, so `tasks` may be read while they happen, as
+        long as it is only read after the switch: a generator will do.
+        '''
+        with self._snapshot_lock:
+            with self._lock:
+                self._sync()
+                self._log.close()
+                self.generation += 1
+                self.records = 0
+                self._log = open(self._log_path(self.generation), 'ab')
+
+            temporary_path = self._snapshot_path() + '.tmp'
+            with open(temporary_path, 'wb') as file:
+                file.write(_encode(['s', self.generation]))
+                for task_id, name, description, status in tasks:
+                    file.write(_encode(['p', task_id.hex, name, description, status]))
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temporary_path, self._snapshot_path())
+            self._sync_directory()
+
+            for generation in self._log_generations():
+                if generation < self.generation:
+                    os.remove(self._log_path(generation))
+
+    def close(self):
+        '''Writes a pending snapshot, if any, and closes the log.'''
+        self._closed.set()
+        self._wake.set()
+        if self._background is not None:
+            self._background.join()
+        with self._lock:
+            if self._log is not None:
+                self._sync()
+                self._log.close()
+                self._log = None
+
+    def _append(self, record):
+        line = _encode(record)
+        with self._lock:
+            self._log.write(line)
+            self._log.flush()
+            self.records += 1
+            self._pending += 1
+            if self._pending >= self.fsync_batch:
+                self._wake.set()
+
+    def _sync(self):
+        if self._pending:
+            os.fsync(self._log.fileno())
+            self._pending = 0
+
+    def _run_background(self):
+        # Fsyncs every fsync_interval, or when woken up for a full batch or
+        # a snapshot, until closed.
+        while True:
+            self._wake.wait(self.fsync_interval)
+            self._wake.clear()
+            with self._lock:
+                if self._log is not None:
+                    self._sync()
+                tasks = self._snapshot_tasks
+            if tasks is not None:
+                self.snapshot(tasks())
+                with self._lock:
+                    self._snapshot_tasks = None
+            if self._closed.is_set():
+                return
+
+    def _sync_directory(self):
+        descriptor = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(descriptor)
+        finally:
+            os.close(descriptor)
+
+    def _snapshot_path(self):
+        return os.path.join(self.directory, 'snapshot')
+
+    def _log_path(self, generation):
+        return os.path.join(self.directory, f'log.{generation:08d}')
+
+    def _log_generations(self):
+        return sorted(
+            int(filename[len('log.'):])
+            for filename in os.listdir(self.directory)
+            if filename.startswith('log.') and filename[len('log.'):].isdigit()
+        )
+
+
+_decoder = json.JSONDecoder()
+
+
+def _encode(record):
+    return json.dumps(record, separators=(',', ':')).encode() + b'\n'
+
+
+def _replay(path, tasks):
+    '''Applies the records in `path` to `tasks`.
+
+    Returns the generation of a snapshot, the number of task records and
+    the size of the file up to the last complete record.
+    '''
+    with open(path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return 0, 0, 0
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            generation = 0
+            records = 0
+            end = 0
+            for line in iter(data.readline, b''):
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    record = _decoder.decode(line.decode())
+                except ValueError:
+                    break
+                if record[0] == 's':
+                    generation = record[1]
+                elif record[0] == 'p':
+                    _, task_id, name, description, status = record
+                    tasks[uuid.UUID(task_id)] = {
+                        'name': name,
+                        'description': description,
+                        'status': status,
+                    }
+                    records += 1
+                elif record[0] == 'd':
+                    tasks.pop(uuid.UUID(record[1]), None)
+                    records += 1
+                end += len(line)
+    return generation, records, end
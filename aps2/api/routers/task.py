@@ -1,8 +1,9 @@
 from typing import Optional, List, Dict
-from fastapi import FastAPI, APIRouter, Path, Body, Query, HTTPException, Depends
+from fastapi import FastAPI, APIRouter, Path, Body, Query, HTTPException, Depends, Response
+from fastapi.responses import JSONResponse
 import uuid
 from ..database import DBSession, get_db
-from ..models import (TaskIn, TaskOut, TaskInUpdate, TaskStatusModel)
+from ..models import (TaskIn, TaskOut, TaskInUpdate, TaskStatusModel, TaskDeleteReturnModel)
 
 router = APIRouter()
 
@@ -56,12 +57,36 @@ def update_task(*, task_id: uuid.UUID = Path(
 @router.delete("/{task_id}",
             summary="Delete Tasks",
             description="Used to delete a task on the dictionary",
-            response_description="Dictionary containing all the remaining tasks",
-            response_model=Dict[uuid.UUID, TaskOut])
+            response_description="Dictionary containing all the remaining tasks, the ID of the deleted task or nothing, depending on the returning parameter",
+            response_model=Dict[uuid.UUID, TaskOut],
+            responses={204: {"description": "Task deleted, nothing returned"}})
 
 def delete_task(*, task_id: uuid.UUID = Path(
         ...,
         description="The ID of the task to be deleted",
         example="Example: 3fa85f64-5717-4562-b3fc-2c963f66afa6"), 
+        returning: TaskDeleteReturnModel = Query(
+        TaskDeleteReturnModel.tasks,
+        description="What to return: all the remaining tasks, only the ID of the deleted task or nothing (204). Returning all the tasks gets slower as the dictionary grows",
+        example="Example: tasks, id, none"),
         db: DBSession = Depends(get_db)):
-    return db.delete_task(task_id)
+    db.delete_task(task_id)
+    if returning == TaskDeleteReturnModel.id:
+        return JSONResponse(content=str(task_id))
+    if returning == TaskDeleteReturnModel.none:
+        return Response(status_code=204)
+    return db.read_task()
+
+
+@router.post("/bulk-delete",
+          summary="Delete Many Tasks",
+          description="Used to delete several tasks on the dictionary at once, IDs of tasks not found are ignored",
+          response_description="List containing the IDs of the deleted tasks",
+          response_model=List[uuid.UUID])
+
+def delete_tasks(task_ids: List[uuid.UUID] = Body(
+        ...,
+        description="The IDs of the tasks to be deleted",
+        example=["3fa85f64-5717-4562-b3fc-2c963f66afa6"]),
+        db: DBSession = Depends(get_db)):
+    return db.delete_tasks(task_ids)
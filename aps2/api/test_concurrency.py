@@ -0,0 +1,84 @@
+import random
+import sys
+import threading
+from fastapi import HTTPException
+from .database import DBSession, open_log, close_log, load_tasks
+from .models import TaskIn, TaskInUpdate
+
+THREADS = 8
+ROUNDS = 500
+
+#Runs writers and readers on the same tasks at once and checks that no
+#write is lost: every task ends with the last update it got, deleted tasks
+#stay deleted, the status index matches the tasks and the log replays to
+#the same store
+def test_concurrent_writes_are_not_lost(tmp_path):
+    saved = list(DBSession.fake_db.values())
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    errors = []
+    try:
+        load_tasks([])
+        open_log(str(tmp_path), snapshot_every=500)
+        db = DBSession()
+        tasks = [db.create_task(TaskIn(name=f"t{i}", description="0")) for i in range(16)]
+        # Each writer owns the description counter of its own task, and all
+        # of them flip the status of shared ones and race to delete them
+        owned = tasks[:THREADS]
+        shared = tasks[THREADS:]
+        stop = threading.Event()
+
+        def writer(n):
+            try:
+                task_id = owned[n].task_id
+                for i in range(1, ROUNDS + 1):
+                    db.update_task(task_id, TaskInUpdate(description=str(i), status=i % 2 == 0))
+                    other = random.choice(shared).task_id
+                    try:
+                        if random.random() < 0.05:
+                            db.delete_task(other)
+                        else:
+                            db.update_task(other, TaskInUpdate(description="shared", status=random.random() < 0.5))
+                    except HTTPException as exception:
+                        assert exception.status_code == 404
+            except Exception as exception:
+                errors.append(exception)
+
+        def reader():
+            try:
+                while not stop.is_set():
+                    for q in (None, "done", "not_done"):
+                        for task in db.read_task(q).values():
+                            assert q is None or task.status == (q == "done")
+            except Exception as exception:
+                errors.append(exception)
+
+        readers = [threading.Thread(target=reader) for _ in range(2)]
+        writers = [threading.Thread(target=writer, args=(n, )) for n in range(THREADS)]
+        for thread in readers + writers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        stop.set()
+        for thread in readers:
+            thread.join()
+
+        assert errors == []
+        for task in owned:
+            stored = db.fake_db[task.task_id]
+            assert stored.description == str(ROUNDS)
+            assert stored.status == (ROUNDS % 2 == 0)
+        for status, status_ids in db.status_index.items():
+            assert set(status_ids) == {
+                task_id for task_id, task in db.fake_db.items() if task.status == status
+            }
+
+        expected = dict(db.fake_db)
+        close_log()
+        load_tasks([])
+        open_log(str(tmp_path))
+        assert DBSession.fake_db == expected
+    finally:
+        sys.setswitchinterval(switch_interval)
+        close_log()
+        load_tasks(saved)
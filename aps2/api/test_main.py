@@ -328,3 +328,92 @@ def test_update_task_with_wrong_status():
             }
         ]
     }
+
+#Changes the status of a task, then deletes it, and checks that
+#the status filters follow along
+def test_read_tasks_by_status_after_update_and_delete():
+    response = client.post(
+        '/task',
+        json={
+            "name": "task 14",
+            "description": "task 14 description"
+        }
+    )
+    task = response.json()
+    uuid = task["task_id"]
+    assert uuid in client.get('/task?status=not_done').json()
+    assert uuid not in client.get('/task?status=done').json()
+
+    response = client.patch(
+        f'/task/{uuid}',
+        json={
+            "description": "task 14 description",
+            'status': True
+        }
+    )
+    assert response.status_code == 200
+    assert uuid not in client.get('/task?status=not_done').json()
+    assert client.get('/task?status=done').json()[uuid] == response.json()
+
+    response = client.delete(
+        f'/task/{uuid}'
+    )
+    assert response.status_code == 200
+    assert uuid not in client.get('/task?status=not_done').json()
+    assert uuid not in client.get('/task?status=done').json()
+
+#Checks that a delete can return only the deleted id or nothing
+def test_delete_task_returning_id_or_nothing():
+    uuids = []
+    for name in ["task 15", "task 16"]:
+        response = client.post(
+            '/task',
+            json={
+                "name": name,
+                "description": f"{name} description"
+            }
+        )
+        uuids.append(response.json()["task_id"])
+
+    response = client.delete(
+        f'/task/{uuids[0]}?returning=id'
+    )
+    assert response.status_code == 200
+    assert response.json() == uuids[0]
+
+    response = client.delete(
+        f'/task/{uuids[1]}?returning=none'
+    )
+    assert response.status_code == 204
+    assert response.content == b''
+
+    tasks = client.get('/task').json()
+    assert uuids[0] not in tasks
+    assert uuids[1] not in tasks
+
+#Deletes some tasks at once, one of them twice and one that does not exist,
+#and checks that only the existing ones are returned as deleted
+def test_bulk_delete_tasks():
+    uuids = []
+    for name in ["task 17", "task 18", "task 19"]:
+        response = client.post(
+            '/task',
+            json={
+                "name": name,
+                "description": f"{name} description"
+            }
+        )
+        uuids.append(response.json()["task_id"])
+    wrong_uuid = "5e6bff37-70b3-42bc-a0d0-8c731e12b411"
+
+    response = client.post(
+        '/task/bulk-delete',
+        json=[uuids[0], uuids[1], uuids[0], wrong_uuid]
+    )
+    assert response.status_code == 200
+    assert response.json() == [uuids[0], uuids[1]]
+
+    tasks = client.get('/task').json()
+    assert uuids[0] not in tasks
+    assert uuids[1] not in tasks
+    assert uuids[2] in tasks
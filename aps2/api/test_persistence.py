@@ -0,0 +1,99 @@
+import os
+import threading
+import uuid
+from .database import DBSession, open_log, close_log, load_tasks
+from .models import TaskIn, TaskInUpdate
+from .persistence import TaskLog
+
+#Checks that puts and deletes survive a restart, across snapshots
+def test_log_replays_snapshot_and_tail(tmp_path):
+    log = TaskLog(str(tmp_path), snapshot_every=2)
+    assert log.load() == {}
+    ids = [uuid.uuid4() for _ in range(3)]
+    log.put(ids[0], "t0", "task0", False)
+    log.put(ids[1], "t1", "task1", False)
+    log.snapshot([
+        (ids[0], "t0", "task0", False),
+        (ids[1], "t1", "task1", False),
+    ])
+    log.put(ids[2], "t2", "task2", False)
+    log.put(ids[0], "t0", "task0 done", True)
+    log.delete(ids[1])
+    log.close()
+
+    assert sorted(os.listdir(tmp_path)) == ["log.00000001", "snapshot"]
+
+    log = TaskLog(str(tmp_path))
+    assert log.load() == {
+        ids[0]: {"name": "t0", "description": "task0 done", "status": True},
+        ids[2]: {"name": "t2", "description": "task2", "status": False},
+    }
+    log.close()
+
+#Checks that a record torn by a crash is dropped and does not
+#corrupt the records written after the restart
+def test_log_drops_torn_record(tmp_path):
+    log = TaskLog(str(tmp_path))
+    log.load()
+    task_id = uuid.uuid4()
+    log.put(task_id, "t0", "task0", False)
+    log.close()
+    with open(os.path.join(tmp_path, "log.00000000"), "ab") as file:
+        file.write(b'["p","')
+
+    log = TaskLog(str(tmp_path))
+    assert list(log.load()) == [task_id]
+    log.delete(task_id)
+    log.close()
+
+    log = TaskLog(str(tmp_path))
+    assert log.load() == {}
+    log.close()
+
+#Checks that the store is rebuilt, status index included, after a restart
+def test_store_is_restored_from_log(tmp_path):
+    saved = list(DBSession.fake_db.values())
+    try:
+        open_log(str(tmp_path), snapshot_every=3)
+        db = DBSession()
+        tasks = [db.create_task(TaskIn(name=f"t{i}", description=f"task{i}")) for i in range(5)]
+        done = db.update_task(tasks[0].task_id, TaskInUpdate(description="task0", status=True))
+        db.delete_task(tasks[1].task_id)
+        close_log()
+
+        load_tasks([])
+        open_log(str(tmp_path))
+        db = DBSession()
+        assert db.read_task() == {task.task_id: task for task in [done] + tasks[2:]}
+        assert list(db.read_task("done")) == [done.task_id]
+    finally:
+        close_log()
+        load_tasks(saved)
+
+#Checks that a requested snapshot is written by the background thread,
+#while writes go on without waiting for it
+def test_snapshot_is_written_in_background(tmp_path):
+    log = TaskLog(str(tmp_path), snapshot_every=1)
+    log.load()
+    task_id = uuid.uuid4()
+    store = {task_id: ("t0", "task0", False)}
+    log.put(task_id, *store[task_id])
+    assert log.needs_snapshot()
+
+    release = threading.Event()
+    def tasks():
+        release.wait()
+        for stored_id, fields in list(store.items()):
+            yield (stored_id, *fields)
+    log.request_snapshot(tasks)
+    assert not log.needs_snapshot()
+    store[task_id] = ("t0", "task0 done", True)
+    log.put(task_id, *store[task_id])
+    assert not os.path.exists(os.path.join(tmp_path, "snapshot"))
+
+    release.set()
+    log.close()
+    assert os.path.exists(os.path.join(tmp_path, "snapshot"))
+    log = TaskLog(str(tmp_path))
+    assert log.load() == {task_id: {"name": "t0", "description": "task0 done", "status": True}}
+    log.close()
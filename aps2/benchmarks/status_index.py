@@ -0,0 +1,70 @@
+'''Compares filtered task reads with a full scan and with the status index.
+
+Run from the aps2 directory:
+
+    python -m benchmarks.status_index --tasks 100000 1000000
+'''
+import argparse
+import random
+import time
+
+from api.database import DBSession
+from api.models import TaskIn, TaskInUpdate, TaskStatusModel
+
+
+def scan_read_task(db, q):
+    '''The filtered read as it was before the status index.'''
+    q_dict = {}
+    for task in db.fake_db.values():
+        if task.status and q == TaskStatusModel.done:
+            q_dict.update({task.task_id: task})
+        elif not task.status and q == TaskStatusModel.not_done:
+            q_dict.update({task.task_id: task})
+    return q_dict
+
+
+def fill(db, tasks, done_ratio):
+    db.fake_db.clear()
+    for status_ids in db.status_index.values():
+        status_ids.clear()
+
+    task = TaskIn(name='task', description='description')
+    done = random.sample(range(tasks), int(tasks * done_ratio))
+    ids = [db.create_task(task).task_id for _ in range(tasks)]
+    update = TaskInUpdate(description='description', status=True)
+    for i in done:
+        db.update_task(ids[i], update)
+
+
+def best_of(repeat, function, *args):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tasks', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--done-ratio', type=float, default=0.99)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    db = DBSession()
+    for tasks in args.tasks:
+        fill(db, tasks, args.done_ratio)
+        for q in TaskStatusModel:
+            scan_time, scan_result = best_of(args.repeat, scan_read_task, db, q)
+            index_time, index_result = best_of(args.repeat, db.read_task, q)
+            assert scan_result.keys() == index_result.keys()
+            print(
+                f'{tasks:>8} tasks  status={q.value:<8}  matching={len(index_result):>8}  '
+                f'scan={scan_time * 1000:9.2f}ms  index={index_time * 1000:9.2f}ms  '
+                f'speedup={scan_time / index_time:7.1f}x'
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+'''Measures the memory the task store takes per task, as TaskOut and as TaskRecord.
+
+Run from the aps2 directory:
+
+    python -m benchmarks.store_memory --tasks 1000000
+'''
+import argparse
+import gc
+import tracemalloc
+import uuid
+
+from api.database import TaskRecord
+from api.models import TaskOut
+
+
+def bytes_per_task(tasks, make_task):
+    gc.collect()
+    tracemalloc.start()
+    store = {}
+    for i in range(tasks):
+        task_id = uuid.uuid4()
+        store[task_id] = make_task(task_id, f'task {i}', f'description of task {i}', False)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del store
+    return size / tasks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tasks', type=int, default=1000000)
+    args = parser.parse_args()
+
+    stores = {
+        'TaskOut': lambda task_id, name, description, status: TaskOut(
+            task_id=task_id,
+            name=name,
+            description=description,
+            status=status,
+        ),
+        'TaskRecord': TaskRecord,
+    }
+    for name, make_task in stores.items():
+        print(f'{name:<10} {bytes_per_task(args.tasks, make_task):8.1f} bytes/task')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# pylint: disable=missing-module-docstring
+import asyncio
+import json
+
+
+class Response:
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    def json(self):
+        return json.loads(self.content)
+
+
+async def request(app, method, url, json_body=None, headers=None):
+    '''Sends one HTTP request straight to an ASGI app, in-process.
+
+    Unlike `TestClient`, many of these can run concurrently on the same event
+    loop, which is what the benchmarks need to measure.
+    '''
+    path, _, query = url.partition('?')
+    body = b'' if json_body is None else json.dumps(json_body).encode()
+    raw_headers = [
+        (b'host', b'benchmark'),
+        (b'content-type', b'application/json'),
+        (b'content-length', str(len(body)).encode()),
+    ]
+    raw_headers.extend(
+        (name.lower().encode(), value.encode())
+        for name, value in (headers or {}).items()
+    )
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'root_path': '',
+        'query_string': query.encode(),
+        'headers': raw_headers,
+        'client': ('127.0.0.1', 0),
+        'server': ('benchmark', 80),
+    }
+
+    body_sent = False
+    disconnected = asyncio.Event()
+
+    async def receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        await disconnected.wait()
+        return {'type': 'http.disconnect'}
+
+    status_code = None
+    response_headers = {}
+    chunks = []
+
+    async def send(message):
+        nonlocal status_code
+        if message['type'] == 'http.response.start':
+            status_code = message['status']
+            response_headers.update(
+                (name.decode().lower(), value.decode())
+                for name, value in message.get('headers', [])
+            )
+        elif message['type'] == 'http.response.body':
+            chunks.append(message.get('body', b''))
+
+    try:
+        await app(scope, receive, send)
+    finally:
+        disconnected.set()
+
+    return Response(status_code, response_headers, b''.join(chunks))
@@ -0,0 +1,147 @@
+# pylint: disable=missing-module-docstring, missing-function-docstring
+import asyncio
+import statistics
+import time
+
+from argparse import ArgumentParser
+from concurrent.futures import Executor, Future
+
+from utils import utils
+
+from tasklist.database import get_executor, get_settings
+from tasklist.main import app
+
+from .asgi import request
+
+
+class InlineExecutor(Executor):
+    '''Runs submitted calls right away on the calling thread.
+
+    Used as a baseline: with it, every database call blocks the event loop,
+    exactly as the handlers did before they were dispatched to an executor.
+    '''
+
+    def submit(self, fn, /, *args, **kwargs):  # pylint: disable=arguments-differ
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as exception:  # pylint: disable=broad-except
+            future.set_exception(exception)
+        return future
+
+
+class SlowExecutor(Executor):
+    '''Runs every call on `executor` after sleeping `delay` seconds.
+
+    The sleep stands in for a slow query: it happens wherever the database
+    call runs, on the event loop with InlineExecutor, on a worker thread
+    with the real executor.
+    '''
+
+    def __init__(self, executor, delay):
+        self.executor = executor
+        self.delay = delay
+
+    def submit(self, fn, /, *args, **kwargs):  # pylint: disable=arguments-differ
+        def slow():
+            time.sleep(self.delay)
+            return fn(*args, **kwargs)
+
+        return self.executor.submit(slow)
+
+
+def returning(executor):
+    # Not a default argument: FastAPI would take it for a query parameter
+    def get_benchmark_executor():
+        return executor
+
+    return get_benchmark_executor
+
+
+async def monitor_lag(stop, lags, interval=0.005):
+    '''Records how late the event loop wakes up from `interval` second sleeps.'''
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - start - interval)
+
+
+async def timed_request(url, latencies):
+    start = time.perf_counter()
+    response = await request(app, 'GET', url)
+    latencies.append(time.perf_counter() - start)
+    assert response.status_code == 200, response.content
+
+
+async def run(url, requests, concurrency):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def worker():
+        async with semaphore:
+            await timed_request(url, latencies)
+
+    lags = []
+    stop = asyncio.Event()
+    monitor = asyncio.ensure_future(monitor_lag(stop, lags))
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(requests)))
+    wall = time.perf_counter() - start
+    stop.set()
+    await monitor
+    return wall, latencies, lags
+
+
+def report(name, concurrency, wall, latencies, lags):
+    print(
+        f'{name:>9} c={concurrency:<3} '
+        f'wall={wall * 1000:9.1f}ms '
+        f'rps={len(latencies) / wall:9.1f} '
+        f'mean={statistics.mean(latencies) * 1000:7.2f}ms '
+        f'loop lag mean={statistics.mean(lags or [0.0]) * 1000:7.2f}ms '
+        f'max={max(lags or [0.0]) * 1000:7.2f}ms'
+    )
+
+
+async def benchmark(args):
+    for _ in range(args.tasks):
+        await request(app, 'POST', '/task', {'description': 'benchmark'})
+
+    modes = [
+        ('blocking', InlineExecutor()),
+        ('executor', get_executor(get_settings(args.config))),
+    ]
+    for name, executor in modes:
+        executor = SlowExecutor(executor, args.delay)
+        app.dependency_overrides[get_executor] = returning(executor)
+        for concurrency in (1, args.concurrency):
+            await run(args.url, args.concurrency, concurrency)  # warm up
+            wall, latencies, lags = await run(args.url, args.requests, concurrency)
+            report(name, concurrency, wall, latencies, lags)
+
+    app.dependency_overrides.pop(get_executor, None)
+    await request(app, 'DELETE', '/task')
+
+
+def main():
+    parser = ArgumentParser(
+        description='Compare blocking and executor-dispatched database access '
+                    'under concurrent requests.',
+    )
+    parser.add_argument('--config', default=utils.get_config_test_filename(),
+                        help='Service config file')
+    parser.add_argument('--url', default='/task', help='Endpoint to request')
+    parser.add_argument('--tasks', type=int, default=100,
+                        help='Tasks to create before the run')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--delay', type=float, default=0.02,
+                        help='Seconds added to every database call, as a slow query')
+    args = parser.parse_args()
+
+    app.dependency_overrides[utils.get_config_filename] = lambda: args.config
+    asyncio.run(benchmark(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,366 @@
+# pylint: disable=missing-module-docstring, missing-function-docstring, missing-class-docstring
+import asyncio
+import json
+import math
+import os.path
+import random
+import sys
+import time
+
+from argparse import ArgumentParser
+
+from utils import utils
+
+from tasklist.database import get_settings
+from tasklist.main import app
+
+from .asgi import request
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'load_baseline.json')
+# Endpoints with fewer samples are too noisy to compare with the baseline.
+MIN_SAMPLES = 20
+
+
+class Dataset:
+    '''What the workload knows exists in the database.
+
+    `users` and `tasks` are seeded and only read or altered. Whatever the
+    workload creates goes to `new_users` and `new_tasks`, and only those are
+    deleted, so the seeded data set keeps its size during the run.
+    '''
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.users = []
+        self.tasks = []
+        self.new_users = []
+        self.new_tasks = []
+
+    def user(self):
+        return self.rng.choice(self.users)
+
+    def task(self):
+        return self.rng.choice(self.tasks)
+
+    def task_body(self, user_id=None):
+        return {
+            'description': f'task {self.rng.randrange(1 << 30)}',
+            'completed': self.rng.random() < 0.5,
+            'user_id': str(user_id or self.user()),
+        }
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, endpoint, seconds, ok):
+        self.latencies.setdefault(endpoint, []).append(seconds)
+        if not ok:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def summary(self, wall):
+        everything = [
+            seconds
+            for latencies in self.latencies.values()
+            for seconds in latencies
+        ]
+        return {
+            'wall_seconds': wall,
+            'total': _summarize(everything, wall, sum(self.errors.values())),
+            'endpoints': {
+                endpoint: _summarize(latencies, wall, self.errors.get(endpoint, 0))
+                for endpoint, latencies in sorted(self.latencies.items())
+            },
+        }
+
+
+def _percentile(ordered, percent):
+    # Nearest rank
+    return ordered[max(math.ceil(percent / 100 * len(ordered)) - 1, 0)]
+
+
+def _summarize(latencies, wall, errors):
+    ordered = sorted(latencies)
+    return {
+        'requests': len(ordered),
+        'errors': errors,
+        'throughput': len(ordered) / wall,
+        'p50_ms': _percentile(ordered, 50) * 1000,
+        'p95_ms': _percentile(ordered, 95) * 1000,
+        'p99_ms': _percentile(ordered, 99) * 1000,
+    }
+
+
+async def call(stats, endpoint, method, url, json_body=None, expected=(200, )):
+    start = time.perf_counter()
+    response = await request(app, method, url, json_body)
+    stats.record(endpoint, time.perf_counter() - start, response.status_code in expected)
+    return response
+
+
+# Each operation sends one request of the mix. They only target rows they
+# know exist, so any status but the expected ones is an error.
+
+async def list_tasks(stats, data):
+    completed = data.rng.choice(['', '&completed=true', '&completed=false'])
+    await call(stats, 'GET /task', 'GET', f'/task?limit=100{completed}')
+
+
+async def export_tasks(stats, data):  # pylint: disable=unused-argument
+    await call(stats, 'GET /task/export', 'GET', '/task/export?completed=true')
+
+
+async def create_task(stats, data):
+    response = await call(stats, 'POST /task', 'POST', '/task', data.task_body())
+    data.new_tasks.append(response.json())
+
+
+async def create_tasks(stats, data):
+    body = [data.task_body() for _ in range(10)]
+    response = await call(stats, 'POST /task/batch', 'POST', '/task/batch', body)
+    data.new_tasks.extend(response.json())
+
+
+async def read_task(stats, data):
+    await call(stats, 'GET /task/{uuid_}', 'GET', f'/task/{data.task()}')
+
+
+async def replace_task(stats, data):
+    await call(stats, 'PUT /task/{uuid_}', 'PUT', f'/task/{data.task()}', data.task_body())
+
+
+async def alter_task(stats, data):
+    body = {'completed': data.rng.random() < 0.5}
+    await call(stats, 'PATCH /task/{uuid_}', 'PATCH', f'/task/{data.task()}', body)
+
+
+async def alter_tasks(stats, data):
+    body = {'description': f'bulk {data.rng.randrange(1 << 30)}'}
+    url = f'/task?user_id={data.user()}&completed=true'
+    await call(stats, 'PATCH /task', 'PATCH', url, body)
+
+
+async def remove_task(stats, data):
+    while not data.new_tasks:
+        await create_task(stats, data)
+    uuid_ = data.new_tasks.pop(data.rng.randrange(len(data.new_tasks)))
+    await call(stats, 'DELETE /task/{uuid_}', 'DELETE', f'/task/{uuid_}')
+
+
+async def remove_tasks(stats, data):
+    # Only the tasks of a user created during the run
+    while not data.new_users:
+        await create_user(stats, data)
+    user_id = data.rng.choice(data.new_users)
+    await call(stats, 'DELETE /task', 'DELETE', f'/task?user_id={user_id}')
+
+
+async def list_users(stats, data):  # pylint: disable=unused-argument
+    await call(stats, 'GET /user', 'GET', '/user?limit=100')
+
+
+async def create_user(stats, data):
+    body = {'username': f'user {data.rng.randrange(1 << 30)}'}
+    response = await call(stats, 'POST /user', 'POST', '/user', body)
+    data.new_users.append(response.json())
+
+
+async def read_user(stats, data):
+    await call(stats, 'GET /user/{uuid_}', 'GET', f'/user/{data.user()}')
+
+
+async def read_user_tasks(stats, data):
+    url = f'/user/{data.user()}/tasks?limit=100'
+    await call(stats, 'GET /user/{uuid_}/tasks', 'GET', url)
+
+
+async def replace_user(stats, data):
+    body = {'username': f'user {data.rng.randrange(1 << 30)}'}
+    await call(stats, 'PUT /user/{uuid_}', 'PUT', f'/user/{data.user()}', body)
+
+
+async def alter_user(stats, data):
+    body = {'username': f'user {data.rng.randrange(1 << 30)}'}
+    await call(stats, 'PATCH /user/{uuid_}', 'PATCH', f'/user/{data.user()}', body)
+
+
+async def remove_user(stats, data):
+    while not data.new_users:
+        await create_user(stats, data)
+    uuid_ = data.new_users.pop(data.rng.randrange(len(data.new_users)))
+    await call(stats, 'DELETE /user/{uuid_}', 'DELETE', f'/user/{uuid_}')
+
+
+# Operation and relative weight: mostly reads, as in a typical task list.
+WORKLOAD = [
+    (list_tasks, 15),
+    (export_tasks, 1),
+    (create_task, 8),
+    (create_tasks, 2),
+    (read_task, 20),
+    (replace_task, 4),
+    (alter_task, 6),
+    (alter_tasks, 1),
+    (remove_task, 5),
+    (remove_tasks, 1),
+    (list_users, 5),
+    (create_user, 3),
+    (read_user, 10),
+    (read_user_tasks, 10),
+    (replace_user, 2),
+    (alter_user, 3),
+    (remove_user, 2),
+]
+
+
+async def seed(args, data, stats):
+    '''Creates `args.users` users with `args.tasks_per_user` tasks each.'''
+    batch_size = get_settings(args.config)['max_batch_size']
+    await call(stats, 'DELETE /user', 'DELETE', '/user')
+    await call(stats, 'DELETE /task', 'DELETE', '/task')
+    for i in range(args.users):
+        response = await call(stats, 'POST /user', 'POST', '/user', {'username': f'seed {i}'})
+        data.users.append(response.json())
+
+    bodies = [
+        data.task_body(user_id)
+        for user_id in data.users
+        for _ in range(args.tasks_per_user)
+    ]
+    for start in range(0, len(bodies), batch_size):
+        batch = bodies[start:start + batch_size]
+        response = await call(stats, 'POST /task/batch', 'POST', '/task/batch', batch)
+        data.tasks.extend(response.json())
+
+
+async def run(args, data, stats):
+    operations, weights = zip(*WORKLOAD)
+    mix = data.rng.choices(operations, weights, k=args.requests)
+    queue = iter(mix)
+
+    async def worker():
+        for operation in queue:
+            await operation(stats, data)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    return time.perf_counter() - start
+
+
+async def benchmark(args):
+    data = Dataset(random.Random(args.seed))
+
+    seed_stats = Stats()
+    start = time.perf_counter()
+    await seed(args, data, seed_stats)
+    seed_wall = time.perf_counter() - start
+    print(f'Seeded {len(data.users)} users and {len(data.tasks)} tasks in {seed_wall:.1f}s')
+
+    await run(args, data, Stats())  # warm up
+    stats = Stats()
+    wall = await run(args, data, stats)
+
+    # Deleting everything is part of the API too, but only once per run.
+    start = time.perf_counter()
+    await call(stats, 'DELETE /task', 'DELETE', '/task')
+    await call(stats, 'DELETE /user', 'DELETE', '/user')
+    wall += time.perf_counter() - start
+
+    results = stats.summary(wall)
+    results['parameters'] = {
+        'users': args.users,
+        'tasks_per_user': args.tasks_per_user,
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'seed': args.seed,
+    }
+    return results
+
+
+def report(results):
+    print(
+        f'{"endpoint":<26} {"requests":>8} {"errors":>6} {"req/s":>9} '
+        f'{"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8}'
+    )
+    rows = list(results['endpoints'].items()) + [('total', results['total'])]
+    for endpoint, summary in rows:
+        print(
+            f'{endpoint:<26} {summary["requests"]:>8} {summary["errors"]:>6} '
+            f'{summary["throughput"]:>9.1f} {summary["p50_ms"]:>8.2f} '
+            f'{summary["p95_ms"]:>8.2f} {summary["p99_ms"]:>8.2f}'
+        )
+
+
+def regressions(results, baseline, threshold):
+    '''Describes every way `results` is worse than `baseline` by more than `threshold`.'''
+    found = []
+    if results['parameters'] != baseline['parameters']:
+        return [f'parameters differ from the baseline: {baseline["parameters"]}']
+
+    total, baseline_total = results['total'], baseline['total']
+    if total['throughput'] < baseline_total['throughput'] * (1 - threshold):
+        found.append(
+            f'total throughput {total["throughput"]:.1f} req/s, '
+            f'baseline {baseline_total["throughput"]:.1f} req/s'
+        )
+    for endpoint, summary in results['endpoints'].items():
+        baseline_summary = baseline['endpoints'].get(endpoint)
+        if baseline_summary is None or min(summary['requests'], baseline_summary['requests']) < MIN_SAMPLES:
+            continue
+        if summary['p95_ms'] > baseline_summary['p95_ms'] * (1 + threshold):
+            found.append(
+                f'{endpoint} p95 {summary["p95_ms"]:.2f}ms, '
+                f'baseline {baseline_summary["p95_ms"]:.2f}ms'
+            )
+    return found
+
+
+def main():
+    parser = ArgumentParser(
+        description='Seed a data set and drive every task and user endpoint '
+                    'with a concurrent request mix.',
+    )
+    parser.add_argument('--config', default=utils.get_config_test_filename(),
+                        help='Service config file')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--tasks-per-user', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--seed', type=int, default=0, help='Random seed of the mix')
+    parser.add_argument('--output', default='load_results.json',
+                        help='Where to save the results as JSON')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE,
+                        help='Results to compare with, if the file exists')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Tolerated slowdown, as a fraction of the baseline')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='Store these results as the new baseline')
+    args = parser.parse_args()
+
+    app.dependency_overrides[utils.get_config_filename] = lambda: args.config
+    results = asyncio.run(benchmark(args))
+    report(results)
+
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=4)
+
+    failures = []
+    if results['total']['errors']:
+        failures.append(f'{results["total"]["errors"]} requests failed')
+    if args.save_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump(results, file, indent=4)
+        print(f'Saved baseline to {args.baseline}')
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as file:
+            failures.extend(regressions(results, json.load(file), args.threshold))
+
+    for failure in failures:
+        print(f'FAIL: {failure}')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+# pylint: disable=missing-module-docstring, missing-function-docstring, missing-class-docstring
+import asyncio
+import inspect
+
+from argparse import ArgumentParser
+
+from utils import utils
+
+from tasklist.database import get_db
+from tasklist.main import app
+
+from .asgi import request
+
+MISSING = '3668e9c9-df18-4ce2-9bb2-82f907cf110c'
+
+
+class Counter:
+    def __init__(self):
+        self.statements = 0
+        self.commits = 0
+
+
+class CountingCursor:
+    def __init__(self, cursor, counter):
+        self._cursor = cursor
+        self._counter = counter
+
+    def execute(self, *args, **kwargs):
+        self._counter.statements += 1
+        return self._cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        self._counter.statements += 1
+        return self._cursor.executemany(*args, **kwargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._cursor.__exit__(*exc_info)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class CountingConnection:
+    def __init__(self, connection, counter):
+        self._connection = connection
+        self._counter = counter
+
+    def cursor(self, *args, **kwargs):
+        return CountingCursor(self._connection.cursor(*args, **kwargs), self._counter)
+
+    def commit(self):
+        self._counter.commits += 1
+        return self._connection.commit()
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+def counting(counter):
+    '''Wraps `get_db` so every session it yields counts its round trips.'''
+    async def get_counting_db(**kwargs):
+        sessions = get_db(**kwargs)
+        db = await sessions.__anext__()
+        db.session.connection = CountingConnection(db.session.connection, counter)
+        try:
+            yield db
+        finally:
+            await sessions.aclose()
+
+    get_counting_db.__signature__ = inspect.signature(get_db)
+    return get_counting_db
+
+
+async def measure(counter, method, url, json_body=None):
+    counter.statements = counter.commits = 0
+    response = await request(app, method, url, json_body)
+    print(
+        f'{method:>6} {url:<48} {response.status_code} '
+        f'statements={counter.statements} commits={counter.commits}'
+    )
+    return response
+
+
+async def benchmark():
+    counter = Counter()
+    app.dependency_overrides[get_db] = counting(counter)
+
+    for kind, body in (('task', {'description': 'foo'}), ('user', {'username': 'foo'})):
+        uuid_ = (await measure(counter, 'POST', f'/{kind}', body)).json()
+        await measure(counter, 'GET', f'/{kind}')
+        await measure(counter, 'GET', f'/{kind}?limit=10')
+        await measure(counter, 'GET', f'/{kind}/{uuid_}')
+        await measure(counter, 'GET', f'/{kind}/{MISSING}')
+        await measure(counter, 'PUT', f'/{kind}/{uuid_}', body)
+        await measure(counter, 'PUT', f'/{kind}/{MISSING}', body)
+        await measure(counter, 'PATCH', f'/{kind}/{uuid_}', body)
+        await measure(counter, 'DELETE', f'/{kind}/{uuid_}')
+        await measure(counter, 'DELETE', f'/{kind}/{MISSING}')
+
+    app.dependency_overrides.pop(get_db)
+
+
+def main():
+    parser = ArgumentParser(description='Count database statements per endpoint.')
+    parser.add_argument('--config', default=utils.get_config_test_filename(),
+                        help='Service config file')
+    args = parser.parse_args()
+
+    app.dependency_overrides[utils.get_config_filename] = lambda: args.config
+    asyncio.run(benchmark())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,2 @@
+CREATE INDEX tasks_user_id_completed ON tasks (user_id, completed, uuid);
+CREATE INDEX tasks_completed ON tasks (completed, uuid);
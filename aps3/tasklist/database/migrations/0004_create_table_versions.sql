@@ -0,0 +1,7 @@
+DROP TABLE IF EXISTS table_versions;
+CREATE TABLE table_versions (
+    table_name VARCHAR(64) PRIMARY KEY,
+    version BIGINT NOT NULL
+);
+
+INSERT INTO table_versions (table_name, version) VALUES ('tasks', 0), ('users', 0);
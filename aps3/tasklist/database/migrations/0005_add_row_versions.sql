@@ -0,0 +1,2 @@
+ALTER TABLE tasks ADD version BIGINT NOT NULL DEFAULT 1;
+ALTER TABLE users ADD version BIGINT NOT NULL DEFAULT 1;
@@ -0,0 +1 @@
+CREATE INDEX tasks_user_id ON tasks (user_id, uuid);
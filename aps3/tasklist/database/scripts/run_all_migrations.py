@@ -4,13 +4,27 @@ from utils.utils import run_all_scripts
 
 
 def main():
-    parser = ArgumentParser(description='Run all migration scripts.')
+    parser = ArgumentParser(description='Run all migration scripts not applied yet.')
     parser.add_argument('migrations_dir', help='Directory with the migrations')
     parser.add_argument('config', help='Service config file')
     parser.add_argument('secrets', help='Service database admin secrets')
+    parser.add_argument(
+        '--baseline',
+        help='Record the migrations up to this one (e.g. 0005_add_row_versions) '
+             'as applied without running them, for a database migrated before '
+             'migrations were tracked',
+    )
 
     args = parser.parse_args()
-    run_all_scripts(args.migrations_dir, args.config, args.secrets)
+    applied = run_all_scripts(
+        args.migrations_dir,
+        args.config,
+        args.secrets,
+        baseline=args.baseline,
+        progress=print,
+    )
+    for name in applied:
+        print(f'Applied {name}')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,295 @@
+import itertools
+import json
+import os
+import random
+import tempfile
+import time
+
+from argparse import ArgumentParser
+from operator import itemgetter
+
+from tasklist.backends import get_backend_credentials, make_backend
+
+
+# Version 4 and RFC 4122 variant bits, as set by uuid.uuid4()
+_UUID4_CLEAR = ~((0xf000 << 64) | (0xc000 << 48))
+_UUID4_SET = (0x4000 << 64) | (0x8000 << 48)
+
+
+def random_uuids(rng, count):
+    # Same bytes as uuid.UUID(int=..., version=4).bytes, without the objects
+    getrandbits = rng.getrandbits
+    return [((getrandbits(128) & _UUID4_CLEAR) | _UUID4_SET).to_bytes(16, 'big') for _ in range(count)]
+
+
+def tasks_per_user(rng, distribution, mean):
+    '''Number of tasks of one user, `mean` on average.'''
+    if distribution == 'fixed':
+        return mean
+    if distribution == 'uniform':
+        return rng.randint(0, 2 * mean)
+    # A few users with many tasks and most with a few
+    return int(rng.expovariate(1 / mean)) if mean else 0
+
+
+def generate_users(rng, count):
+    return [(uuid_, f'seed user {i}') for i, uuid_ in enumerate(random_uuids(rng, count))]
+
+
+def generate_tasks(rng, user_ids, distribution, mean, completed_ratio):
+    '''Lists of the tasks of each user in turn.'''
+    first = 0
+    uniform = rng.random
+    for user_id in user_ids:
+        uuids = random_uuids(rng, tasks_per_user(rng, distribution, mean))
+        yield [
+            (uuid_, f'seed task {i}', uniform() < completed_ratio, user_id)
+            for i, uuid_ in enumerate(uuids, first)
+        ]
+        first += len(uuids)
+
+
+def batches(chunks, size):
+    '''Lists of `size` rows out of the lists `chunks`, sorted by their first column.
+
+    Random uuids are spread all over the primary key index; inserting a
+    batch in key order touches each of its pages once instead of at random.
+    '''
+    rows = itertools.chain.from_iterable(chunks)
+    while True:
+        batch = list(itertools.islice(rows, size))
+        if not batch:
+            return
+        batch.sort(key=itemgetter(0))
+        yield batch
+
+
+def insert(connection, table, columns, chunks, batch_size, commit=True):
+    '''Inserts the rows of `chunks` with one multi-row INSERT per batch.
+
+    Each batch is committed if `commit`, otherwise the transaction is left
+    open for the caller.
+    '''
+    query = (
+        f'INSERT INTO {table} ({", ".join(columns)}) '
+        f'VALUES ({", ".join(["%s"] * len(columns))})'
+    )
+    count = 0
+    with connection.cursor() as cursor:
+        for batch in batches(chunks, batch_size):
+            # Sent as a single multi-row INSERT by the MySQL connector, and
+            # as one prepared statement run for every row by sqlite3.
+            cursor.executemany(query, batch)
+            if commit:
+                connection.commit()
+            count += len(batch)
+    return count
+
+
+def load_data(connection, table, columns, chunks, batch_size, commit=True):
+    '''Loads the rows of `chunks` with LOAD DATA LOCAL INFILE, through temp files.
+
+    Binary columns (the uuids) are written in hex and unhexed by the server,
+    so no value needs escaping.
+    '''
+    count = 0
+    for batch in batches(chunks, batch_size):
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', suffix='.tsv', delete=False) as file:
+            for row in batch:
+                file.write('\t'.join(_tsv_field(value) for value in row))
+                file.write('\n')
+        try:
+            variables = [f'@{column}' for column in columns]
+            assignments = ', '.join(
+                f'{column} = UNHEX(@{column})' if isinstance(value, bytes)
+                else f'{column} = @{column}'
+                for column, value in zip(columns, batch[0])
+            )
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'''
+                    LOAD DATA LOCAL INFILE %s INTO TABLE {table}
+                    FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n'
+                    ({", ".join(variables)}) SET {assignments}
+                    ''',
+                    (file.name, ),
+                )
+            if commit:
+                connection.commit()
+        finally:
+            os.remove(file.name)
+        count += len(batch)
+    return count
+
+
+def _tsv_field(value):
+    if isinstance(value, bytes):
+        return value.hex()
+    if isinstance(value, bool):
+        return str(int(value))
+    return str(value)
+
+
+def prepare_connection(backend, connection):
+    '''Turns off the checks the generated rows do not need, for this connection only.
+
+    Every task is generated for a user inserted before it, and uuids are
+    random, so foreign keys and uniqueness hold by construction.
+    '''
+    with connection.cursor() as cursor:
+        if backend.name == 'mysql':
+            cursor.execute('SET SESSION foreign_key_checks = 0, unique_checks = 0')
+        else:
+            cursor.execute('PRAGMA foreign_keys = OFF')
+            # Keep the indexes being filled in memory (1 GiB at most)
+            cursor.execute('PRAGMA cache_size = -1048576')
+
+
+def drop_secondary_indexes(connection, tables):
+    '''Drops the SQLite indexes created on `tables` and returns their SQL.
+
+    Building an index from the full table sorts its keys once, which is
+    cheaper than inserting every random uuid in it one row at a time.
+    Primary keys, indexed by SQLite itself, are kept.
+    '''
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL "
+            "AND tbl_name IN (" + ', '.join(['%s'] * len(tables)) + ")",
+            tables,
+        )
+        indexes = cursor.fetchall()
+        for name, _ in indexes:
+            cursor.execute(f'DROP INDEX {name}')
+    return [sql for _, sql in indexes]
+
+
+def is_empty(connection, table):
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT 1 FROM {table} LIMIT 1')
+        return cursor.fetchone() is None
+
+
+def is_loaded(connection, user_id):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1 FROM users WHERE uuid = %s', (user_id, ))
+        return cursor.fetchone() is not None
+
+
+def create_indexes(connection, statements):
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def bump_versions(connection):
+    # So that running services drop what they cached from these tables
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "UPDATE table_versions SET version = version + 1 "
+            "WHERE table_name IN ('tasks', 'users')"
+        )
+
+
+def seed(backend, connection, args, load):
+    '''Loads the users and tasks, returning their counts and the time it took.
+
+    On SQLite everything, dropping and rebuilding the indexes included, is
+    a single transaction: nothing is left half done if it fails, but other
+    writers wait for the whole load. On MySQL each batch is committed, to
+    keep the undo log small.
+    '''
+    rng = random.Random(args.seed)
+    single_transaction = backend.name == 'sqlite'
+
+    users = generate_users(rng, args.users)
+    if users and is_loaded(connection, users[0][0]):
+        raise ValueError(f'The rows of seed {args.seed} are already in the database')
+
+    start = time.perf_counter()
+    try:
+        # MySQL keeps its indexes: the one on tasks.user_id backs the foreign
+        # key. Rebuilding them over rows already there would cost more than
+        # adding the new ones.
+        deferred = []
+        if backend.name == 'sqlite' and not args.keep_indexes and is_empty(connection, 'tasks'):
+            deferred = drop_secondary_indexes(connection, ('users', 'tasks'))
+        user_count = load(
+            connection,
+            'users',
+            ('uuid', 'username'),
+            [users],
+            args.batch_size,
+            commit=not single_transaction,
+        )
+        task_count = load(
+            connection,
+            'tasks',
+            ('uuid', 'description', 'completed', 'user_id'),
+            generate_tasks(
+                rng,
+                [user_id for user_id, _ in users],
+                args.distribution,
+                args.tasks_per_user,
+                args.completed_ratio,
+            ),
+            args.batch_size,
+            commit=not single_transaction,
+        )
+        create_indexes(connection, deferred)
+        bump_versions(connection)
+        connection.commit()
+    except BaseException:
+        connection.rollback()
+        raise
+    return user_count, task_count, time.perf_counter() - start
+
+
+def main():
+    parser = ArgumentParser(description='Fill the database with synthetic users and tasks.')
+    parser.add_argument('config', help='Service config file')
+    parser.add_argument('secrets', help='Service database admin secrets')
+    parser.add_argument('--users', type=int, default=1000, help='Number of users')
+    parser.add_argument('--tasks-per-user', type=int, default=1000,
+                        help='Average number of tasks of a user')
+    parser.add_argument('--distribution', choices=('fixed', 'uniform', 'exponential'),
+                        default='fixed', help='Distribution of the number of tasks of a user')
+    parser.add_argument('--completed-ratio', type=float, default=0.5,
+                        help='Fraction of the tasks that are completed')
+    parser.add_argument('--batch-size', type=int, default=100000,
+                        help='Rows per INSERT, or per file with --load-data')
+    parser.add_argument('--load-data', action='store_true',
+                        help='Use LOAD DATA LOCAL INFILE (MySQL only)')
+    parser.add_argument('--keep-indexes', action='store_true',
+                        help='On SQLite, fill the secondary indexes row by row instead of '
+                             'dropping them during the load and rebuilding them after, '
+                             'as is done when there are no tasks yet')
+    parser.add_argument('--seed', type=int,
+                        help='Random seed, for the same rows on every run (random by default)')
+
+    args = parser.parse_args()
+    with open(args.config, 'r') as file:
+        config = json.load(file)
+    credentials = get_backend_credentials(config, args.config, args.secrets)
+    if args.load_data:
+        if credentials['backend'] != 'mysql':
+            parser.error('--load-data needs the mysql backend')
+        credentials['allow_local_infile'] = True
+
+    backend = make_backend(credentials)
+    connection = backend.connect()
+    try:
+        prepare_connection(backend, connection)
+        users, tasks, seconds = seed(backend, connection, args, load_data if args.load_data else insert)
+    except ValueError as error:
+        parser.error(str(error))
+    finally:
+        connection.close()
+    print(
+        f'Seeded {users} users and {tasks} tasks in {seconds:.1f}s '
+        f'({(users + tasks) / seconds:.0f} rows/s)'
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,298 @@
+# pylint: disable=missing-module-docstring, missing-function-docstring, missing-class-docstring
+import hashlib
+import itertools
+import json
+import os.path
+import sqlite3
+import threading
+import uuid
+
+
+class Backend:
+    '''Storage engine behind DBSession.
+
+    DBSession speaks a single SQL dialect: MySQL's, with `%s` placeholders and
+    the UUID_TO_BIN / BIN_TO_UUID functions. Each backend hands out DB-API
+    connections that understand that dialect, and knows how to check, reset
+    and run migration scripts on them.
+    '''
+
+    name = None
+
+    def connect(self):
+        raise NotImplementedError()
+
+    def ping(self, connection):
+        raise NotImplementedError()
+
+    def reset(self, connection):
+        raise NotImplementedError()
+
+    def run_script(self, connection, script: str):
+        raise NotImplementedError()
+
+    def explain(self, connection, query: str, params=None):
+        '''The plan of `query`, as a list of dicts, without running it.'''
+        raise NotImplementedError()
+
+    def table_names(self, connection):
+        '''Names of the tables of the database, as a set.'''
+        raise NotImplementedError()
+
+
+class MySQLBackend(Backend):
+    name = 'mysql'
+
+    def __init__(self, host, database, user, password, allow_local_infile=False):
+        self.credentials = {
+            'host': host,
+            'database': database,
+            'user': user,
+            'password': password,
+            'allow_local_infile': allow_local_infile,
+        }
+
+    def connect(self):
+        import mysql.connector  # pylint: disable=import-outside-toplevel
+        from mysql.connector.constants import ClientFlag  # pylint: disable=import-outside-toplevel
+
+        # FOUND_ROWS makes UPDATE report matched rows rather than changed
+        # ones, so rowcount tells whether the row exists.
+        return mysql.connector.connect(
+            client_flags=[ClientFlag.FOUND_ROWS],
+            **self.credentials,
+        )
+
+    def ping(self, connection):
+        import mysql.connector  # pylint: disable=import-outside-toplevel
+
+        try:
+            connection.ping(reconnect=False)
+        except mysql.connector.Error:
+            return False
+        return True
+
+    def reset(self, connection):
+        connection.reset_session()
+
+    def run_script(self, connection, script: str):
+        with connection.cursor() as cursor:
+            # One has to iterate through the results to get them executed properly
+            # when using multi=True in this library. Makes sense after reflecting
+            # on it: each cursor has to be exhausted before emitting another
+            # command. Docs are not that clear, though:
+            # https://dev.mysql.com/doc/connector-python/en/connector-python-api-mysqlcursor-execute.html
+            for _ in cursor.execute(script, multi=True):
+                pass
+        connection.commit()
+
+    def explain(self, connection, query: str, params=None):
+        return _explain(connection, 'EXPLAIN ' + query, params)
+
+    def table_names(self, connection):
+        return _table_names(
+            connection,
+            'SELECT TABLE_NAME FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE()',
+        )
+
+
+class SQLiteCursor:
+    '''sqlite3 cursor accepting `%s` placeholders, usable in a `with`.'''
+
+    def __init__(self, connection, cursor):
+        self._connection = connection
+        self._cursor = cursor
+
+    def execute(self, query, params=()):
+        self._connection.begin(query)
+        self._cursor.execute(query.replace('%s', '?'), params)
+        return self
+
+    def executemany(self, query, seq_params):
+        self._connection.begin(query)
+        self._cursor.executemany(query.replace('%s', '?'), seq_params)
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._cursor.close()
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class SQLiteConnection:
+    '''sqlite3 connection with MySQL-like transactions.
+
+    As with MySQL with autocommit off, the first write opens a transaction
+    that lasts until commit or rollback, so savepoints nest inside it
+    instead of committing on release. The transaction takes the write lock
+    right away (BEGIN IMMEDIATE): a transaction that read first and only
+    then tried to write would fail at once, not wait, whenever another
+    connection was writing. Reads and pragmas before the first write run on
+    their own.
+    '''
+
+    def __init__(self, connection):
+        self.raw = connection
+
+    def begin(self, query: str):
+        if self.raw.in_transaction:
+            return
+        if query.split(None, 1)[0].upper() not in ('SELECT', 'EXPLAIN', 'PRAGMA'):
+            self.raw.execute('BEGIN IMMEDIATE')
+
+    def cursor(self):
+        return SQLiteCursor(self, self.raw.cursor())
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+    def close(self):
+        self.raw.close()
+
+
+def _uuid_to_bin(value):
+    return None if value is None else uuid.UUID(value).bytes
+
+
+def _bin_to_uuid(value):
+    return None if value is None else str(uuid.UUID(bytes=bytes(value)))
+
+
+class SQLiteBackend(Backend):
+    '''Embedded backend on a SQLite file, in WAL mode, or in memory.
+
+    In-memory databases are shared by every backend created with the same
+    `memory_name` in the process, and live as long as the process does, so
+    the migrations, the pool and the slow-query log all see one database.
+    Without a name, the database is private to this backend. They use the
+    memdb VFS (SQLite 3.36+) rather than a shared cache, whose table locks
+    fail at once instead of waiting for `busy_timeout`.
+    '''
+
+    name = 'sqlite'
+    _memory_ids = itertools.count()
+    _memory_keepalives = {}
+    _memory_lock = threading.Lock()
+
+    def __init__(self, path, busy_timeout=5.0, memory_name=None):
+        self.busy_timeout = busy_timeout
+        self._keepalive = None
+        if path == ':memory:':
+            self.uri = True
+            if memory_name is None:
+                self.path = f'file:/tasklist-{os.getpid()}-{next(self._memory_ids)}?vfs=memdb'
+                # The database disappears with its last connection.
+                self._keepalive = self._connect()
+            else:
+                digest = hashlib.sha1(memory_name.encode()).hexdigest()[:16]
+                self.path = f'file:/tasklist-{digest}?vfs=memdb'
+                with self._memory_lock:
+                    if self.path not in self._memory_keepalives:
+                        self._memory_keepalives[self.path] = self._connect()
+                self._keepalive = self._memory_keepalives[self.path]
+        else:
+            self.path = path
+            self.uri = False
+
+    def _connect(self):
+        connection = sqlite3.connect(
+            self.path,
+            uri=self.uri,
+            timeout=self.busy_timeout,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        connection.create_function('UUID_TO_BIN', 1, _uuid_to_bin, deterministic=True)
+        connection.create_function('BIN_TO_UUID', 1, _bin_to_uuid, deterministic=True)
+        connection.execute('PRAGMA foreign_keys = ON')
+        if not self.uri:
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute('PRAGMA synchronous = NORMAL')
+        return connection
+
+    def connect(self):
+        return SQLiteConnection(self._connect())
+
+    def ping(self, connection):
+        try:
+            connection.raw.execute('SELECT 1')
+        except sqlite3.Error:
+            return False
+        return True
+
+    def reset(self, connection):
+        connection.rollback()
+
+    def run_script(self, connection, script: str):
+        connection.raw.executescript(script)
+
+    def explain(self, connection, query: str, params=None):
+        return _explain(connection, 'EXPLAIN QUERY PLAN ' + query, params)
+
+    def table_names(self, connection):
+        return _table_names(
+            connection,
+            # Leaving out SQLite's own, such as sqlite_sequence
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'",
+        )
+
+
+def _explain(connection, query, params):
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(query, () if params is None else params)
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+    finally:
+        # Do not keep a transaction, and its snapshot, open between plans
+        connection.rollback()
+
+
+def _table_names(connection, query):
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(query)
+            return {name for name, in cursor.fetchall()}
+    finally:
+        connection.rollback()
+
+
+def get_backend_credentials(config: dict, config_file_name: str, secrets_file_name: str):
+    '''Everything needed to open connections to the database in `config`.
+
+    Only the MySQL backend reads the secrets file.
+    '''
+    backend = config.get('backend', 'mysql')
+    if backend == 'sqlite':
+        path = config.get('sqlite_path', ':memory:')
+        if path == ':memory:':
+            # One in-memory database per config file
+            return {'backend': 'sqlite', 'path': path, 'memory_name': os.path.abspath(config_file_name)}
+        path = os.path.join(os.path.dirname(os.path.abspath(config_file_name)), path)
+        return {'backend': 'sqlite', 'path': path}
+    if backend == 'mysql':
+        with open(secrets_file_name, 'r') as file:
+            secrets = json.load(file)
+        return {
+            'backend': 'mysql',
+            'user': secrets['user'],
+            'password': secrets['password'],
+            'host': config['db_host'],
+            'database': config['database'],
+        }
+    raise ValueError(f'Unknown database backend: {backend}')
+
+
+def make_backend(credentials: dict):
+    credentials = dict(credentials)
+    backend = credentials.pop('backend', 'mysql')
+    if backend == 'sqlite':
+        return SQLiteBackend(**credentials)
+    return MySQLBackend(**credentials)
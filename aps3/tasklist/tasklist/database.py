@@ -1,36 +1,229 @@
 # pylint: disable=missing-module-docstring, missing-function-docstring, missing-class-docstring
+import asyncio
+import contextlib
 import json
+import os.path
+import threading
+import time
 import uuid
 
-from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from typing import List
 
-import mysql.connector as conn
-
-from fastapi import Depends
+from fastapi import Depends, Request, Response
+from fastapi.routing import APIRoute
 
 from utils.utils import get_config_filename, get_app_secrets_filename
 
+from .backends import get_backend_credentials, make_backend
+from .cache import LRUCache
+from .metrics import DB_POOL_WAIT_SECONDS, TimedCursor
 from .models import Task, User
+from .pool import ConnectionPool
+from .slow_queries import SlowQueryLog
+
+
+class VersionConflict(Exception):
+    def __init__(self, current_version: int):
+        super().__init__(current_version)
+        self.current_version = current_version
+
+
+class AsyncDBSession:
+    '''Awaitable view of a DBSession.
+
+    Every method call is dispatched to a bounded thread pool, so blocking
+    database I/O never runs on the event loop.
+    '''
+
+    def __init__(self, session: 'DBSession', executor):
+        self.session = session
+        self.executor = executor
+
+    def __getattr__(self, name):
+        attribute = getattr(self.session, name)
+        if not callable(attribute):
+            return attribute
+
+        async def method(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self.executor,
+                partial(attribute, *args, **kwargs),
+            )
+
+        return method
+
+    @contextlib.asynccontextmanager
+    async def savepoint(self):
+        name = await self.begin_savepoint()
+        try:
+            yield
+        except BaseException:
+            await self.rollback_to_savepoint(name)
+            raise
+        await self.release_savepoint(name)
+
+    async def iterate(self, iterator):
+        '''Drains a blocking iterator from the executor, one item at a time.'''
+        loop = asyncio.get_running_loop()
+        done = object()
+        while True:
+            item = await loop.run_in_executor(self.executor, next, iterator, done)
+            if item is done:
+                return
+            yield item
 
 
 class DBSession:
-    def __init__(self, connection: conn.MySQLConnection):
+    def __init__(
+            self,
+            connection,
+            task_cache: LRUCache = None,
+            user_cache: LRUCache = None,
+            slow_queries: SlowQueryLog = None,
+    ):
         self.connection = connection
+        self.task_cache = LRUCache(max_size=0) if task_cache is None else task_cache
+        self.user_cache = LRUCache(max_size=0) if user_cache is None else user_cache
+        self.slow_queries = slow_queries
+        self.dirty = False
+        self._changed_tables = set()
+        self._after_commit = []
+        self._savepoints = 0
+        self._open_savepoints = 0
+
+    def commit(self):
+        '''Commits everything written since the last commit, if anything.
+
+        The versions of the tables written are bumped here, with a single
+        statement right before the commit. Every writer of a table updates
+        its one row in table_versions, so writers of a table do queue on
+        that row's lock, but only for the time of the commit rather than
+        for the whole transaction.
+        '''
+        if not self.dirty:
+            return
+        if self._changed_tables:
+            tables = sorted(self._changed_tables)
+            with self.__cursor('bump_versions') as cursor:
+                cursor.execute(
+                    'UPDATE table_versions SET version = version + 1 WHERE table_name IN ('
+                    + ', '.join(['%s'] * len(tables)) + ')',
+                    tables,
+                )
+        self.connection.commit()
+        self.dirty = False
+        self._changed_tables = set()
+        after_commit, self._after_commit = self._after_commit, []
+        for callback in after_commit:
+            callback()
+
+    def rollback(self):
+        if not self.dirty:
+            return
+        self.connection.rollback()
+        self.dirty = False
+        self._changed_tables = set()
+        # The keys written were already dropped, but drop them once more now
+        # that the rows are back to their committed values.
+        after_commit, self._after_commit = self._after_commit, []
+        for invalidate in after_commit:
+            invalidate()
+
+    def begin_savepoint(self):
+        self._savepoints += 1
+        name = f'savepoint_{self._savepoints}'
+        with self.__cursor('savepoint') as cursor:
+            cursor.execute(f'SAVEPOINT {name}')
+        self._open_savepoints += 1
+        return name
+
+    def release_savepoint(self, name: str):
+        with self.__cursor('savepoint') as cursor:
+            cursor.execute(f'RELEASE SAVEPOINT {name}')
+        self._open_savepoints -= 1
+
+    def rollback_to_savepoint(self, name: str):
+        with self.__cursor('savepoint') as cursor:
+            cursor.execute(f'ROLLBACK TO SAVEPOINT {name}')
+            cursor.execute(f'RELEASE SAVEPOINT {name}')
+        self._open_savepoints -= 1
+        # Kept for the commit too: the writes before the savepoint stand.
+        for invalidate in self._after_commit:
+            invalidate()
+
+    @contextlib.contextmanager
+    def savepoint(self):
+        '''Nested transaction: undone on its own if the block raises.'''
+        name = self.begin_savepoint()
+        try:
+            yield
+        except BaseException:
+            self.rollback_to_savepoint(name)
+            raise
+        self.release_savepoint(name)
+
+    def __cursor(self, statement: str):
+        '''Cursor whose statements are timed under the name `statement`.'''
+        on_finish = None if self.slow_queries is None else self.slow_queries.record
+        return TimedCursor(self.connection.cursor(), statement, on_finish)
+
+    def __changed(self, *tables: str):
+        '''Marks the transaction as dirty, and the tables' versions to bump on commit.'''
+        self._changed_tables.update(tables)
+        self.dirty = True
+
+    def __invalidate(self, cache: LRUCache, key=None):
+        '''Drops `key` (everything if None) from `cache`, now and on commit.
+
+        Invalidating again after the commit makes sure no reader that ran
+        before the commit can leave the old value cached.
+        '''
+        invalidate = cache.clear if key is None else partial(cache.invalidate, key)
+        invalidate()
+        self._after_commit.append(invalidate)
+
+    def read_versions(self, *tables: str):
+        '''Reads the write counters of `tables`, bumped by every commit writing to them.'''
+        with self.__cursor('read_versions') as cursor:
+            cursor.execute(
+                'SELECT table_name, version FROM table_versions WHERE table_name IN ('
+                + ', '.join(['%s'] * len(tables)) + ')',
+                tables,
+            )
+            versions = dict(cursor.fetchall())
+
+        return tuple(versions[table] for table in tables)
 
-    def read_tasks(self, completed: bool = None):
+    def read_tasks(
+            self,
+            completed: bool = None,
+            limit: int = None,
+            after: uuid.UUID = None,
+    ):
         query = 'SELECT BIN_TO_UUID(uuid), description, completed, BIN_TO_UUID(user_id) FROM tasks'
+        conditions = []
+        params = []
         if completed is not None:
-            query += ' WHERE completed = '
-            if completed:
-                query += 'True'
-            else:
-                query += 'False'
-
-        with self.connection.cursor() as cursor:
-            cursor.execute(query)
+            conditions.append('completed = %s')
+            params.append(completed)
+        if after is not None:
+            conditions.append('uuid > UUID_TO_BIN(%s)')
+            params.append(str(after))
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        if limit is not None:
+            # Fetching one extra row tells whether there is a next page.
+            query += ' ORDER BY uuid LIMIT %s'
+            params.append(limit + 1)
+
+        with self.__cursor('read_tasks') as cursor:
+            cursor.execute(query, tuple(params))
             db_results = cursor.fetchall()
-            print(db_results)
 
+        db_results, next_key = _split_page(db_results, limit)
         return {
             uuid_: Task(
                 description=field_description,
@@ -38,28 +231,87 @@ class DBSession:
                 user_id = field_user_id
             )
             for uuid_, field_description, field_completed, field_user_id in db_results
-        }
+        }, next_key
+
+    def export_tasks(self, completed: bool = None, batch_size: int = 1000):
+        '''Yields every task, as lists of at most `batch_size` plain dicts.
+
+        The cursor is unbuffered, so rows are streamed from the server as they
+        are fetched instead of being loaded all at once.
+        '''
+        query = 'SELECT BIN_TO_UUID(uuid), description, completed, BIN_TO_UUID(user_id) FROM tasks'
+        params = ()
+        if completed is not None:
+            query += ' WHERE completed = %s'
+            params = (completed, )
+
+        with self.__cursor('export_tasks') as cursor:
+            cursor.execute(query, params)
+            while True:
+                db_results = cursor.fetchmany(batch_size)
+                if not db_results:
+                    break
+                yield [
+                    {
+                        'uuid': uuid_,
+                        'description': field_description,
+                        'completed': bool(field_completed),
+                        'user_id': field_user_id,
+                    }
+                    for uuid_, field_description, field_completed, field_user_id in db_results
+                ]
 
     def create_task(self, item: Task):
         uuid_ = uuid.uuid4()
 
-        with self.connection.cursor() as cursor:
+        with self.__cursor('create_task') as cursor:
             cursor.execute(
-                'INSERT INTO tasks VALUES (UUID_TO_BIN(%s), %s, %s, UUID_TO_BIN(%s))',
+                '''
+                INSERT INTO tasks (uuid, description, completed, user_id)
+                VALUES (UUID_TO_BIN(%s), %s, %s, UUID_TO_BIN(%s))
+                ''',
                 (str(uuid_), item.description, item.completed, item.user_id),
             )
-        self.connection.commit()
+            self.__changed('tasks')
 
         return uuid_
 
-    def read_task(self, uuid_: uuid.UUID):
-        if not self.__task_exists(uuid_):
-            raise KeyError()
+    def create_tasks(self, items: List[Task]):
+        uuids = [uuid.uuid4() for _ in items]
 
-        with self.connection.cursor() as cursor:
+        with self.__cursor('create_tasks') as cursor:
+            # Sent as a single multi-row INSERT by the connector.
+            cursor.executemany(
+                '''
+                INSERT INTO tasks (uuid, description, completed, user_id)
+                VALUES (UUID_TO_BIN(%s), %s, %s, UUID_TO_BIN(%s))
+                ''',
+                [
+                    (str(uuid_), item.description, item.completed, item.user_id)
+                    for uuid_, item in zip(uuids, items)
+                ],
+            )
+            self.__changed('tasks')
+
+        return uuids
+
+    def read_task(self, uuid_: uuid.UUID):
+        task, _ = self.read_task_with_version(uuid_)
+        return task
+
+    def read_task_with_version(self, uuid_: uuid.UUID):
+        # Once the transaction wrote, the cache is neither read, as it may
+        # be older than the transaction's own writes, nor filled, as the
+        # transaction's rows are not committed yet.
+        generation = self.task_cache.generation
+        cached = None if self.dirty else self.task_cache.get(uuid_)
+        if cached is not None:
+            return cached
+
+        with self.__cursor('read_task') as cursor:
             cursor.execute(
                 '''
-                SELECT description, completed, BIN_TO_UUID(user_id)
+                SELECT description, completed, BIN_TO_UUID(user_id), version
                 FROM tasks
                 WHERE uuid = UUID_TO_BIN(%s)
                 ''',
@@ -67,88 +319,191 @@ class DBSession:
             )
             result = cursor.fetchone()
 
-        return Task(description=result[0], completed=bool(result[1]), user_id = result[2])
-
-    def replace_task(self, uuid_, item):
-        print("entrou replace task")
-        if not self.__task_exists(uuid_):
+        if result is None:
             raise KeyError()
 
-        with self.connection.cursor() as cursor:
+        task = Task(description=result[0], completed=bool(result[1]), user_id = result[2])
+        if not self.dirty:
+            self.task_cache.put(uuid_, (task, result[3]), generation)
+
+        return task, result[3]
+
+    def replace_task(self, uuid_, item):
+        with self.__cursor('replace_task') as cursor:
             cursor.execute(
                 '''
-                UPDATE tasks SET description=%s, completed=%s, user_id = UUID_TO_BIN(%s)
+                UPDATE tasks SET description=%s, completed=%s, user_id = UUID_TO_BIN(%s),
+                    version = version + 1
                 WHERE uuid=UUID_TO_BIN(%s)
                 ''',
                 (item.description, item.completed, item.user_id, str(uuid_)),
             )
+            found = cursor.rowcount > 0
+            if found:
+                self.__changed('tasks')
 
-        self.connection.commit()
-
-    def remove_task(self, uuid_):
-        if not self.__task_exists(uuid_):
+        if not found:
             raise KeyError()
 
-        with self.connection.cursor() as cursor:
+        self.__invalidate(self.task_cache, uuid_)
+
+    def alter_task(self, uuid_, update_data: dict, expected_version: int = None):
+        return self.__alter_row('alter_task', 'tasks', self.task_cache, uuid_, update_data, expected_version)
+
+    def remove_task(self, uuid_):
+        with self.__cursor('remove_task') as cursor:
             cursor.execute(
                 'DELETE FROM tasks WHERE uuid=UUID_TO_BIN(%s)',
                 (str(uuid_), ),
             )
-        self.connection.commit()
+            found = cursor.rowcount > 0
+            if found:
+                self.__changed('tasks')
+
+        if not found:
+            raise KeyError()
+
+        self.__invalidate(self.task_cache, uuid_)
 
     def remove_all_tasks(self):
-        with self.connection.cursor() as cursor:
+        with self.__cursor('remove_all_tasks') as cursor:
             cursor.execute('DELETE FROM tasks')
-        self.connection.commit()
-
-    def __task_exists(self, uuid_: uuid.UUID):
-        with self.connection.cursor() as cursor:
-            cursor.execute(
-                '''
-                SELECT EXISTS(
-                    SELECT 1 FROM tasks WHERE uuid=UUID_TO_BIN(%s)
+            removed = cursor.rowcount
+            self.__changed('tasks')
+        self.__invalidate(self.task_cache)
+
+        return removed
+
+    def alter_tasks(
+            self,
+            update_data: dict,
+            completed: bool = None,
+            user_id: uuid.UUID = None,
+            chunk_size: int = 1000,
+    ):
+        if not update_data:
+            return 0
+
+        assignments, params = _assignments(update_data)
+        return self.__run_in_chunks(
+            'alter_tasks',
+            'UPDATE tasks SET ' + assignments,
+            params,
+            *_task_filter(completed, user_id),
+            chunk_size,
+        )
+
+    def remove_tasks(
+            self,
+            completed: bool = None,
+            user_id: uuid.UUID = None,
+            chunk_size: int = 1000,
+    ):
+        return self.__run_in_chunks(
+            'remove_tasks',
+            'DELETE FROM tasks',
+            [],
+            *_task_filter(completed, user_id),
+            chunk_size,
+        )
+
+    def __run_in_chunks(self, name, statement, params, conditions, condition_params, chunk_size):
+        '''Runs an UPDATE or DELETE on the tasks matching `conditions`.
+
+        The matching rows are processed in consecutive primary-key ranges of
+        at most `chunk_size` rows. When nothing was written yet and no
+        savepoint is open, each range is committed on its own, so no single
+        transaction holds locks on the whole set. Otherwise committing would
+        also commit the earlier writes, which the caller may still roll
+        back: the ranges then stay in the current transaction. Returns the
+        number of rows matched.
+        '''
+        commit_chunks = not self.dirty and not self._open_savepoints
+        matched = 0
+        after = None
+        with self.__cursor(name) as cursor:
+            while True:
+                range_conditions = list(conditions)
+                range_params = list(condition_params)
+                if after is not None:
+                    range_conditions.append('uuid > %s')
+                    range_params.append(after)
+
+                # The last key of this chunk bounds the range to update.
+                cursor.execute(
+                    'SELECT uuid FROM tasks WHERE ' + ' AND '.join(range_conditions or ['TRUE'])
+                    + ' ORDER BY uuid LIMIT 1 OFFSET %s',
+                    (*range_params, chunk_size - 1),
                 )
-                ''',
-                (str(uuid_), ),
-            )
-            results = cursor.fetchone()
-            found = bool(results[0])
+                result = cursor.fetchone()
+                if result is not None:
+                    range_conditions.append('uuid <= %s')
+                    range_params.append(result[0])
 
-        return found
-
-    def read_users(self):
+                cursor.execute(
+                    statement + ' WHERE ' + ' AND '.join(range_conditions or ['TRUE']),
+                    (*params, *range_params),
+                )
+                matched += cursor.rowcount
+                if cursor.rowcount > 0:
+                    self.__changed('tasks')
+                    self.__invalidate(self.task_cache)
+                if commit_chunks:
+                    self.commit()
+
+                if result is None:
+                    return matched
+                after = result[0]
+
+    def read_users(self, limit: int = None, after: uuid.UUID = None):
         query = 'SELECT BIN_TO_UUID(uuid), username FROM users'
-        with self.connection.cursor() as cursor:
-            cursor.execute(query)
+        params = []
+        if after is not None:
+            query += ' WHERE uuid > UUID_TO_BIN(%s)'
+            params.append(str(after))
+        if limit is not None:
+            query += ' ORDER BY uuid LIMIT %s'
+            params.append(limit + 1)
+
+        with self.__cursor('read_users') as cursor:
+            cursor.execute(query, tuple(params))
             db_results = cursor.fetchall()
 
+        db_results, next_key = _split_page(db_results, limit)
         return {
             uuid_: User(
                 username=field_username,
             )
             for uuid_, field_username in db_results
-        }
-        
+        }, next_key
+
     def create_user(self, item: User):
             uuid_ = uuid.uuid4()
 
-            with self.connection.cursor() as cursor:
+            with self.__cursor('create_user') as cursor:
                 cursor.execute(
-                    'INSERT INTO users VALUES (UUID_TO_BIN(%s), %s)',
+                    'INSERT INTO users (uuid, username) VALUES (UUID_TO_BIN(%s), %s)',
                     (str(uuid_), item.username),
                 )
-            self.connection.commit()
+                self.__changed('users')
 
             return uuid_
 
     def read_user(self, uuid_: uuid.UUID):
-        if not self.__user_exists(uuid_):
-            raise KeyError()
+        user, _ = self.read_user_with_version(uuid_)
+        return user
 
-        with self.connection.cursor() as cursor:
+    def read_user_with_version(self, uuid_: uuid.UUID):
+        # As in read_task_with_version
+        generation = self.user_cache.generation
+        cached = None if self.dirty else self.user_cache.get(uuid_)
+        if cached is not None:
+            return cached
+
+        with self.__cursor('read_user') as cursor:
             cursor.execute(
                 '''
-                SELECT username
+                SELECT username, version
                 FROM users
                 WHERE uuid = UUID_TO_BIN(%s)
                 ''',
@@ -156,53 +511,178 @@ class DBSession:
             )
             result = cursor.fetchone()
 
-        return User(username=result[0])
+        if result is None:
+            raise KeyError()
 
-    def replace_user(self, uuid_, item):
-        if not self.__user_exists(uuid_):
+        user = User(username=result[0])
+        if not self.dirty:
+            self.user_cache.put(uuid_, (user, result[1]), generation)
+
+        return user, result[1]
+
+    def read_user_tasks(
+            self,
+            uuid_: uuid.UUID,
+            completed: bool = None,
+            limit: int = None,
+            after: uuid.UUID = None,
+    ):
+        # Joining from users tells a user without tasks (one row of NULLs)
+        # apart from a missing user (no rows) in a single query.
+        query = '''
+            SELECT BIN_TO_UUID(tasks.uuid), tasks.description, tasks.completed,
+                BIN_TO_UUID(tasks.user_id)
+            FROM users
+            LEFT JOIN tasks ON tasks.user_id = users.uuid
+        '''
+        params = []
+        if completed is not None:
+            query += ' AND tasks.completed = %s'
+            params.append(completed)
+        if after is not None:
+            query += ' AND tasks.uuid > UUID_TO_BIN(%s)'
+            params.append(str(after))
+        query += ' WHERE users.uuid = UUID_TO_BIN(%s)'
+        params.append(str(uuid_))
+        if limit is not None:
+            query += ' ORDER BY tasks.uuid LIMIT %s'
+            params.append(limit + 1)
+
+        with self.__cursor('read_user_tasks') as cursor:
+            cursor.execute(query, tuple(params))
+            db_results = cursor.fetchall()
+
+        if not db_results:
             raise KeyError()
 
-        with self.connection.cursor() as cursor:
+        db_results = [result for result in db_results if result[0] is not None]
+        db_results, next_key = _split_page(db_results, limit)
+        return {
+            task_uuid: Task(
+                description=field_description,
+                completed=bool(field_completed),
+                user_id = field_user_id
+            )
+            for task_uuid, field_description, field_completed, field_user_id in db_results
+        }, next_key
+
+    def replace_user(self, uuid_, item):
+        with self.__cursor('replace_user') as cursor:
             cursor.execute(
                 '''
-                UPDATE users SET username=%s
+                UPDATE users SET username=%s, version = version + 1
                 WHERE uuid=UUID_TO_BIN(%s)
                 ''',
                 (item.username, str(uuid_)),
             )
-        self.connection.commit()
+            found = cursor.rowcount > 0
+            if found:
+                self.__changed('users')
 
-    def remove_user(self, uuid_):
-        if not self.__user_exists(uuid_):
+        if not found:
             raise KeyError()
 
-        with self.connection.cursor() as cursor:
+        self.__invalidate(self.user_cache, uuid_)
+
+    def alter_user(self, uuid_, update_data: dict, expected_version: int = None):
+        return self.__alter_row('alter_user', 'users', self.user_cache, uuid_, update_data, expected_version)
+
+    def remove_user(self, uuid_):
+        with self.__cursor('remove_user') as cursor:
             cursor.execute(
                 'DELETE FROM users WHERE uuid=UUID_TO_BIN(%s)',
                 (str(uuid_), ),
             )
-        self.connection.commit()
+            found = cursor.rowcount > 0
+            if found:
+                self.__changed('users', 'tasks')
 
+        if not found:
+            raise KeyError()
+
+        self.__invalidate(self.user_cache, uuid_)
+        # The user's tasks are removed by ON DELETE CASCADE.
+        self.__invalidate(self.task_cache)
+
+
+    def __alter_row(self, name, table, cache, uuid_, update_data, expected_version):
+        '''Applies `update_data` to one row with a single conditional UPDATE.
+
+        When `expected_version` is given, the row is only updated if its
+        version still matches, otherwise VersionConflict is raised. Returns
+        the new version when it is known without another query.
+        '''
+        assignments, params = _assignments(update_data)
+        query = f'UPDATE {table} SET {assignments} WHERE uuid = UUID_TO_BIN(%s)'
+        params.append(str(uuid_))
+        if expected_version is not None:
+            query += ' AND version = %s'
+            params.append(expected_version)
+
+        with self.__cursor(name) as cursor:
+            cursor.execute(query, tuple(params))
+            found = cursor.rowcount > 0
+            if found:
+                self.__changed(table)
+            else:
+                # Only on failure: tell a missing row from a stale version.
+                cursor.execute(
+                    f'SELECT version FROM {table} WHERE uuid = UUID_TO_BIN(%s)',
+                    (str(uuid_), ),
+                )
+                result = cursor.fetchone()
+
+        if not found:
+            if result is None:
+                raise KeyError()
+            raise VersionConflict(result[0])
+
+        self.__invalidate(cache, uuid_)
+
+        if expected_version is None:
+            return None
+        return expected_version + 1
 
     def remove_all_users(self):
-        with self.connection.cursor() as cursor:
+        with self.__cursor('remove_all_users') as cursor:
             cursor.execute('DELETE FROM users')
-        self.connection.commit()
-
-    def __user_exists(self, uuid_: uuid.UUID):
-        with self.connection.cursor() as cursor:
-            cursor.execute(
-                '''
-                SELECT EXISTS(
-                    SELECT 1 FROM users WHERE uuid=UUID_TO_BIN(%s)
-                )
-                ''',
-                (str(uuid_), ),
-            )
-            results = cursor.fetchone()
-            found = bool(results[0])
+            self.__changed('users', 'tasks')
+        self.__invalidate(self.user_cache)
+        self.__invalidate(self.task_cache)
+
+
+def _assignments(update_data: dict):
+    '''Builds the SET clause of a partial update, bumping the row version.'''
+    assignments = []
+    params = []
+    for field, value in update_data.items():
+        if field == 'user_id':
+            assignments.append('user_id = UUID_TO_BIN(%s)')
+        else:
+            assignments.append(f'{field} = %s')
+        params.append(value)
+    assignments.append('version = version + 1')
+    return ', '.join(assignments), params
+
+
+def _task_filter(completed: bool = None, user_id: uuid.UUID = None):
+    conditions = []
+    params = []
+    if completed is not None:
+        conditions.append('completed = %s')
+        params.append(completed)
+    if user_id is not None:
+        conditions.append('user_id = UUID_TO_BIN(%s)')
+        params.append(str(user_id))
+    return conditions, params
+
+
+def _split_page(db_results, limit):
+    if limit is None or len(db_results) <= limit:
+        return db_results, None
+    db_results = db_results[:limit]
+    return db_results, uuid.UUID(db_results[-1][0])
 
-        return found        
 
 @lru_cache
 def get_credentials(
@@ -211,19 +691,259 @@ def get_credentials(
 ):
     with open(config_file_name, 'r') as file:
         config = json.load(file)
-    with open(secrets_file_name, 'r') as file:
-        secrets = json.load(file)
+    return get_backend_credentials(config, config_file_name, secrets_file_name)
+
+
+@lru_cache
+def get_settings(config_file_name: str = Depends(get_config_filename)):
+    with open(config_file_name, 'r') as file:
+        config = json.load(file)
     return {
-        'user': secrets['user'],
-        'password': secrets['password'],
-        'host': config['db_host'],
-        'database': config['database'],
+        'pool_min_size': config.get('pool_min_size', 1),
+        'pool_max_size': config.get('pool_max_size', 10),
+        'pool_timeout': config.get('pool_timeout', 5.0),
+        'pool_ping_interval': config.get('pool_ping_interval', 30.0),
+        'max_batch_size': config.get('max_batch_size', 1000),
+        'bulk_chunk_size': config.get('bulk_chunk_size', 1000),
+        'cache_max_size': config.get('cache_max_size', 10000),
+        'cache_ttl': config.get('cache_ttl', 5.0),
+        'db_executor_workers': config.get(
+            'db_executor_workers',
+            config.get('pool_max_size', 10),
+        ),
+        # More threads waiting than connections would not get one sooner.
+        'db_checkout_workers': config.get(
+            'db_checkout_workers',
+            config.get('pool_max_size', 10),
+        ),
+        # None turns the slow-query log off
+        'slow_query_seconds': config.get('slow_query_seconds'),
+        'slow_query_log': _config_path(config_file_name, config.get('slow_query_log')),
+        'slow_query_log_max_bytes': config.get('slow_query_log_max_bytes', 10 * 1024 * 1024),
+        'slow_query_log_backups': config.get('slow_query_log_backups', 5),
     }
 
 
-def get_db(credentials: dict = Depends(get_credentials)):
+def _config_path(config_file_name: str, path: str):
+    '''Resolves `path` relative to the directory of the config file.'''
+    if path is None:
+        return None
+    return os.path.join(os.path.dirname(os.path.abspath(config_file_name)), path)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _database_key(credentials: dict):
+    return tuple(sorted(credentials.items()))
+
+
+def get_pool(credentials: dict, settings: dict):
+    '''Returns the pool of the database in `credentials`, creating it if needed.
+
+    Creating a pool opens its first connections, which blocks: off the
+    event loop, this is only done by open_pool at startup, or from an
+    executor.
+    '''
+    key = _database_key(credentials)
+    with _pools_lock:
+        pool = _pools.get(key)
+    if pool is not None:
+        return pool
+
+    # Connected outside of the lock, not to hold up the other databases.
+    backend = make_backend(credentials)
+    pool = ConnectionPool(
+        backend.connect,
+        backend.ping,
+        backend.reset,
+        min_size=settings['pool_min_size'],
+        max_size=settings['pool_max_size'],
+        timeout=settings['pool_timeout'],
+        ping_interval=settings['pool_ping_interval'],
+    )
+    with _pools_lock:
+        existing = _pools.setdefault(key, pool)
+    if existing is not pool:
+        pool.close()
+    return existing
+
+
+def open_pool(config_file_name: str):
+    '''Creates the pool of the database in `config_file_name`, before any request needs it.'''
+    get_pool(
+        get_credentials(config_file_name, get_app_secrets_filename()),
+        get_settings(config_file_name),
+    )
+
+
+def close_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_caches(
+        credentials: dict = Depends(get_credentials),
+        settings: dict = Depends(get_settings),
+):
+    '''Returns the task and user caches of the database in `credentials`.'''
+    key = _database_key(credentials)
+    with _caches_lock:
+        caches = _caches.get(key)
+        if caches is None:
+            caches = {
+                name: LRUCache(
+                    max_size=settings['cache_max_size'],
+                    ttl=settings['cache_ttl'],
+                )
+                for name in ('task', 'user')
+            }
+            _caches[key] = caches
+    return caches
+
+
+_slow_query_logs = {}
+_slow_query_logs_lock = threading.Lock()
+
+
+def get_slow_query_log(
+        credentials: dict = Depends(get_credentials),
+        settings: dict = Depends(get_settings),
+):
+    '''Returns the slow-query log of the database in `credentials`, if it is on.'''
+    if settings['slow_query_seconds'] is None:
+        return None
+    key = _database_key(credentials)
+    with _slow_query_logs_lock:
+        slow_queries = _slow_query_logs.get(key)
+        if slow_queries is None:
+            slow_queries = SlowQueryLog(
+                settings['slow_query_seconds'],
+                make_backend(credentials),
+                path=settings['slow_query_log'],
+                max_bytes=settings['slow_query_log_max_bytes'],
+                backup_count=settings['slow_query_log_backups'],
+            )
+            _slow_query_logs[key] = slow_queries
+    return slow_queries
+
+
+def close_slow_query_logs():
+    with _slow_query_logs_lock:
+        slow_query_logs = list(_slow_query_logs.values())
+        _slow_query_logs.clear()
+    for slow_queries in slow_query_logs:
+        slow_queries.close()
+
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def _get_named_executor(name: str, max_workers: int):
+    with _executors_lock:
+        executor = _executors.get(name)
+        if executor is None:
+            executor = ThreadPoolExecutor(
+                max_workers=max_workers,
+                thread_name_prefix=f'tasklist-{name}',
+            )
+            _executors[name] = executor
+    return executor
+
+
+def get_executor(settings: dict = Depends(get_settings)):
+    '''Threads running the sessions' database calls.'''
+    return _get_named_executor('db', settings['db_executor_workers'])
+
+
+def get_checkout_executor(settings: dict = Depends(get_settings)):
+    '''Threads waiting for a connection of the pool.
+
+    Kept apart from the loop's default executor, which Starlette also runs
+    sync dependencies and endpoints on: requests stuck waiting for a
+    connection must not hold up those of the others.
+    '''
+    return _get_named_executor('checkout', settings['db_checkout_workers'])
+
+
+def close_executors():
+    with _executors_lock:
+        executors = list(_executors.values())
+        _executors.clear()
+    for executor in executors:
+        executor.shutdown(wait=True)
+
+
+async def get_db(
+        request: Request,
+        credentials: dict = Depends(get_credentials),
+        settings: dict = Depends(get_settings),
+        executor=Depends(get_executor),
+        checkout_executor=Depends(get_checkout_executor),
+        caches: dict = Depends(get_caches),
+        slow_queries: SlowQueryLog = Depends(get_slow_query_log),
+):
+    '''Yields a session whose transaction spans the whole request.
+
+    The transaction is committed by UnitOfWorkRoute once the endpoint
+    returns, and rolled back here if it did not get that far.
+
+    Waiting for a connection blocks a thread of `checkout_executor`, while
+    the connection is rolled back and released on `executor`: were both
+    done on the same threads, requests waiting for a connection could take
+    all of them and leave none to release one. The wait is bounded from
+    the request's arrival, time spent queued for a checkout thread included.
+    '''
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(_database_key(credentials))
+    if pool is None:
+        # Not created at startup, e.g. for another config
+        pool = await loop.run_in_executor(checkout_executor, get_pool, credentials, settings)
+    start = time.perf_counter()
+    try:
+        connection = await loop.run_in_executor(
+            checkout_executor,
+            partial(pool.acquire, deadline=time.monotonic() + pool.timeout),
+        )
+    finally:
+        DB_POOL_WAIT_SECONDS.observe(time.perf_counter() - start)
     try:
-        connection = conn.connect(**credentials)
-        yield DBSession(connection)
+        session = DBSession(connection, caches['task'], caches['user'], slow_queries)
+        db = AsyncDBSession(session, executor)
+        request.state.db = db
+        try:
+            yield db
+        finally:
+            await db.rollback()
     finally:
-        connection.close()
+        await loop.run_in_executor(executor, pool.release, connection)
+
+
+class UnitOfWorkRoute(APIRoute):
+    '''Commits the request's database session after a successful endpoint.
+
+    Committing here rather than when get_db exits means the commit happens
+    before the response is sent, so a client can always read its own writes.
+    Endpoints that raise, HTTPException included, are never committed.
+    '''
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def route_handler(request: Request) -> Response:
+            response = await handler(request)
+            db = getattr(request.state, 'db', None)
+            if db is not None:
+                await db.commit()
+            return response
+
+        return route_handler
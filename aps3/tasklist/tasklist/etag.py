@@ -0,0 +1,46 @@
+# pylint: disable=missing-module-docstring, missing-function-docstring
+from fastapi import HTTPException, Response
+
+
+def version_etag(*versions):
+    return 'W/"' + '-'.join(str(version) for version in versions) + '"'
+
+
+def row_etag(version: int):
+    return f'"{version}"'
+
+
+def if_match_version(if_match: str):
+    '''Reads the row version out of an If-Match header value.
+
+    Returns None when there is no precondition (no header, or `*`).
+    '''
+    if if_match is None or if_match.strip() == '*':
+        return None
+    try:
+        return int(if_match.strip().strip('"'))
+    except ValueError as exception:
+        raise HTTPException(
+            status_code=400,
+            detail='Invalid If-Match header',
+        ) from exception
+
+
+def etag_matches(if_none_match: str, etag: str):
+    '''Weak comparison of `etag` against an If-None-Match header value.'''
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    etag = etag[2:] if etag.startswith('W/') else etag
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def not_modified(etag: str):
+    return Response(status_code=304, headers={'ETag': etag})
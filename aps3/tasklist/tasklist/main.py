@@ -1,7 +1,13 @@
 # pylint: disable=missing-module-docstring
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
 
-from .routers import task, user
+from . import metrics
+from utils.utils import get_config_filename
+
+from .database import close_executors, close_pools, close_slow_query_logs, open_pool
+from .pool import PoolTimeout
+from .routers import admin, task, user
 
 tags_metadata = [
     {
@@ -13,6 +19,11 @@ tags_metadata = [
         'name': 'user',
         'description': 'Operations related to users.',
     },
+
+    {
+        'name': 'admin',
+        'description': 'Service diagnostics.',
+    },
 ]
 
 app = FastAPI(
@@ -22,4 +33,34 @@ app = FastAPI(
 )
 
 app.include_router(task.router, prefix='/task', tags=['task'])
-app.include_router(user.router, prefix='/user', tags=['user'])
\ No newline at end of file
+app.include_router(user.router, prefix='/user', tags=['user'])
+app.include_router(admin.router, prefix='/admin', tags=['admin'])
+
+app.add_middleware(metrics.RequestMetricsMiddleware)
+
+
+@app.get('/metrics', include_in_schema=False)
+def read_metrics():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.exception_handler(PoolTimeout)
+async def pool_timeout_handler(request: Request, exception: PoolTimeout):  # pylint: disable=unused-argument
+    return JSONResponse(
+        status_code=503,
+        content={'detail': 'Database is busy, try again later'},
+    )
+
+
+@app.on_event('startup')
+def startup():
+    # Run before the server accepts connections, so the first requests do
+    # not block the event loop opening the pool's connections.
+    open_pool(app.dependency_overrides.get(get_config_filename, get_config_filename)())
+
+
+@app.on_event('shutdown')
+def shutdown():
+    close_executors()
+    close_pools()
+    close_slow_query_logs()
@@ -0,0 +1,254 @@
+# pylint: disable=missing-module-docstring, missing-function-docstring
+import bisect
+import threading
+import time
+
+from starlette.routing import Match
+
+CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000)
+
+_registry = []
+
+
+class Histogram:
+    '''Thread-safe Prometheus histogram, with one series per label values.'''
+
+    def __init__(self, name, documentation, label_names=(), buckets=LATENCY_BUCKETS, register=True):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+        if register:
+            _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.label_names)
+        # Past the last bucket only counts towards +Inf
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {
+                    'buckets': [0] * (len(self.buckets) + 1),
+                    'sum': 0.0,
+                    'count': 0,
+                }
+            series['buckets'][index] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def render(self):
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} histogram',
+        ]
+        with self._lock:
+            series = sorted(
+                (key, dict(value, buckets=list(value['buckets'])))
+                for key, value in self._series.items()
+            )
+        for key, value in series:
+            labels = list(zip(self.label_names, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf', ), value['buckets']):
+                cumulative += count
+                bucket_labels = _format_labels(labels + [('le', _format_bound(bound))])
+                lines.append(f'{self.name}_bucket{bucket_labels} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(labels)} {value["sum"]}')
+            lines.append(f'{self.name}_count{_format_labels(labels)} {value["count"]}')
+        return lines
+
+
+def _format_bound(bound):
+    return bound if isinstance(bound, str) else repr(float(bound))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (name, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def render():
+    '''All registered metrics in the Prometheus text exposition format.'''
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+DB_STATEMENT_SECONDS = Histogram(
+    'tasklist_db_statement_seconds',
+    'Time spent executing database statements and fetching their results.',
+    ('statement', ),
+)
+DB_STATEMENT_ROWS = Histogram(
+    'tasklist_db_statement_rows',
+    'Rows fetched or affected by database statements.',
+    ('statement', ),
+    buckets=ROW_BUCKETS,
+)
+DB_POOL_WAIT_SECONDS = Histogram(
+    'tasklist_db_pool_wait_seconds',
+    'Time requests waited for a pooled database connection.',
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    'tasklist_http_request_seconds',
+    'Time spent serving HTTP requests, until the whole response was sent.',
+    ('method', 'route', 'status'),
+)
+
+
+class TimedCursor:
+    '''Cursor wrapper recording time and rows of each statement it runs.
+
+    A statement is observed once its results are done with, that is when
+    the next one is executed or the cursor is closed, so the time spent
+    fetching its rows is included. `on_finish`, if given, is then called
+    with the statement name, its SQL and parameters, whether it was an
+    executemany, its duration and its rows.
+    '''
+
+    def __init__(self, cursor, statement: str, on_finish=None):
+        self._cursor = cursor
+        self.statement = statement
+        self._on_finish = on_finish
+        self._running = False
+        self._query = None
+        self._params = None
+        self._many = False
+        self._seconds = 0.0
+        self._rows = 0
+
+    def execute(self, query, params=None, **kwargs):
+        args = (query, ) if params is None else (query, params)
+        return self._timed_execute(self._cursor.execute, args, kwargs, many=False)
+
+    def executemany(self, query, seq_params, **kwargs):
+        return self._timed_execute(self._cursor.executemany, (query, seq_params), kwargs, many=True)
+
+    def fetchone(self):
+        row = self._timed_fetch(self._cursor.fetchone)
+        if row is not None:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self._timed_fetch(self._cursor.fetchmany, *args, **kwargs)
+        self._rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._timed_fetch(self._cursor.fetchall)
+        self._rows += len(rows)
+        return rows
+
+    def close(self):
+        self._finish()
+        return self._cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def _timed_execute(self, execute, args, kwargs, many):
+        self._finish()
+        self._query = args[0]
+        self._params = args[1] if len(args) > 1 else None
+        self._many = many
+        start = time.perf_counter()
+        self._running = True
+        try:
+            return execute(*args, **kwargs)
+        finally:
+            self._seconds = time.perf_counter() - start
+            # Statements without a result set report the rows they affected
+            if self._cursor.description is None:
+                self._rows = max(self._cursor.rowcount, 0)
+
+    def _timed_fetch(self, fetch, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fetch(*args, **kwargs)
+        finally:
+            self._seconds += time.perf_counter() - start
+
+    def _finish(self):
+        if not self._running:
+            return
+        DB_STATEMENT_SECONDS.observe(self._seconds, statement=self.statement)
+        DB_STATEMENT_ROWS.observe(self._rows, statement=self.statement)
+        if self._on_finish is not None:
+            self._on_finish(
+                self.statement,
+                self._query,
+                self._params,
+                self._many,
+                self._seconds,
+                self._rows,
+            )
+        self._running = False
+        self._query = None
+        self._params = None
+        self._seconds = 0.0
+        self._rows = 0
+
+
+class RequestMetricsMiddleware:
+    '''ASGI middleware timing every HTTP request by method, route and status.
+
+    Routes are labelled with their path template, not the requested path,
+    so the number of series stays bounded.
+    '''
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                method=scope['method'],
+                route=_route_path(scope),
+                status=status,
+            )
+
+
+def _route_path(scope):
+    app = scope.get('app')
+    for route in getattr(app, 'routes', ()):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return 'unmatched'
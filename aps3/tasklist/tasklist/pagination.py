@@ -0,0 +1,25 @@
+# pylint: disable=missing-module-docstring, missing-function-docstring
+import base64
+import binascii
+import uuid
+
+from fastapi import HTTPException
+
+MAX_PAGE_SIZE = 1000
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+
+def encode_cursor(key: uuid.UUID):
+    return base64.urlsafe_b64encode(key.bytes).rstrip(b'=').decode()
+
+
+def decode_cursor(cursor: str):
+    if cursor is None:
+        return None
+    try:
+        return uuid.UUID(bytes=base64.urlsafe_b64decode(cursor + '=='))
+    except (binascii.Error, ValueError) as exception:
+        raise HTTPException(
+            status_code=400,
+            detail='Invalid cursor',
+        ) from exception
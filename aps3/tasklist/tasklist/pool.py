@@ -0,0 +1,160 @@
+# pylint: disable=missing-module-docstring
+import collections
+import contextlib
+import threading
+import time
+
+
+class PoolError(Exception):
+    pass
+
+
+class PoolTimeout(PoolError):
+    pass
+
+
+class PoolClosed(PoolError):
+    pass
+
+
+class ConnectionPool:
+    '''Bounded, thread-safe pool of database connections.
+
+    Connections are created lazily up to `max_size`, and `min_size` of them
+    are opened eagerly. Idle connections are pinged on checkout only if they
+    have been idle for longer than `ping_interval` seconds, and every
+    connection is reset when it is returned, so no session state (open
+    transactions, temporary variables) leaks between requests.
+    '''
+
+    def __init__(
+            self,
+            connect,
+            ping,
+            reset,
+            min_size=1,
+            max_size=10,
+            timeout=5.0,
+            ping_interval=30.0,
+    ):
+        if not 0 <= min_size <= max_size or max_size < 1:
+            raise ValueError('Expected 0 <= min_size <= max_size and max_size >= 1')
+
+        self._connect = connect
+        self._ping = ping
+        self._reset = reset
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+
+        self._idle = collections.deque()
+        self._size = 0
+        self._closed = False
+        self._condition = threading.Condition()
+
+        for _ in range(min_size):
+            self._idle.append((self._connect(), time.monotonic()))
+            self._size += 1
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def idle(self):
+        return len(self._idle)
+
+    def acquire(self, deadline: float = None):
+        '''Checks out a connection, waiting until `deadline` (time.monotonic()) at most.
+
+        The deadline defaults to `timeout` seconds from now.
+        '''
+        if deadline is None:
+            deadline = time.monotonic() + self.timeout
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise PoolClosed('Connection pool is closed')
+                if self._idle:
+                    connection, released_at = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    connection = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(
+                        f'Timed out after {self.timeout}s waiting for a connection'
+                    )
+                self._condition.wait(remaining)
+
+        if connection is not None:
+            if time.monotonic() - released_at < self.ping_interval:
+                return connection
+            if self._ping(connection):
+                return connection
+            self._close_quietly(connection)
+
+        try:
+            return self._connect()
+        except Exception:
+            self._discard()
+            raise
+
+    def release(self, connection):
+        try:
+            self._reset(connection)
+        except Exception:  # pylint: disable=broad-except
+            self._close_quietly(connection)
+            self._discard()
+            return
+
+        with self._condition:
+            if self._closed:
+                self._size -= 1
+                closing = True
+            else:
+                self._idle.append((connection, time.monotonic()))
+                closing = False
+            self._condition.notify()
+
+        if closing:
+            self._close_quietly(connection)
+
+    @contextlib.contextmanager
+    def connection(self):
+        connection = self.acquire()
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+
+    def close(self):
+        '''Closes idle connections and refuses new checkouts.
+
+        Connections still checked out are closed as soon as they are
+        released.
+        '''
+        with self._condition:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._condition.notify_all()
+
+        for connection, _ in idle:
+            self._close_quietly(connection)
+
+    def _discard(self):
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
+
+    @staticmethod
+    def _close_quietly(connection):
+        try:
+            connection.close()
+        except Exception:  # pylint: disable=broad-except
+            pass
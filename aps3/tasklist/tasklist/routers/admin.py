@@ -0,0 +1,34 @@
+# pylint: disable=missing-module-docstring, missing-function-docstring, invalid-name
+from fastapi import APIRouter, Depends, Query
+
+from ..database import get_caches, get_slow_query_log
+from ..slow_queries import SlowQueryLog
+
+router = APIRouter()
+
+
+@router.get(
+    '/cache',
+    summary='Reads cache statistics',
+    description='Reads size, hit, miss, eviction and expiration counters of '
+                'the task and user caches.',
+)
+async def read_cache_stats(caches: dict = Depends(get_caches)):
+    return {name: cache.stats() for name, cache in caches.items()}
+
+
+@router.get(
+    '/slow-queries',
+    summary='Reads the slow-query log',
+    description='Reads the latest statements slower than the configured '
+                '`slow_query_seconds`, newest first, with the shape of their '
+                'parameters, duration, rows and EXPLAIN plan. Empty when the '
+                'slow-query log is off.',
+)
+async def read_slow_queries(
+        limit: int = Query(100, ge=1, le=1000),
+        slow_queries: SlowQueryLog = Depends(get_slow_query_log),
+):
+    if slow_queries is None:
+        return []
+    return slow_queries.recent(limit)
@@ -1,24 +1,65 @@
 # pylint: disable=missing-module-docstring, missing-function-docstring, invalid-name
+import json
 import uuid
 
-from typing import Dict
+from typing import Dict, List
 
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Response
+from fastapi.responses import StreamingResponse
 
-from ..database import DBSession, get_db
+from ..database import AsyncDBSession, UnitOfWorkRoute, VersionConflict, get_db, get_settings
+from ..etag import etag_matches, if_match_version, not_modified, row_etag, version_etag
 from ..models import Task
+from ..pagination import MAX_PAGE_SIZE, NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
 
-router = APIRouter()
+router = APIRouter(route_class=UnitOfWorkRoute)
+
+EXPORT_BATCH_SIZE = 1000
 
 
 @router.get(
     '',
     summary='Reads task list',
-    description='Reads the whole task list.',
+    description='Reads the task list. When `limit` is given, reads one page '
+                'of it; the cursor of the next page, if any, is returned in '
+                f'the `{NEXT_CURSOR_HEADER}` header.',
     response_model=Dict[uuid.UUID, Task],
 )
-async def read_tasks(completed: bool = None, db: DBSession = Depends(get_db)):
-    return db.read_tasks(completed)
+async def read_tasks(
+        response: Response,
+        completed: bool = None,
+        limit: int = Query(None, ge=1, le=MAX_PAGE_SIZE),
+        cursor: str = None,
+        if_none_match: str = Header(None),
+        db: AsyncDBSession = Depends(get_db),
+):
+    # Read before the list, so a concurrent write can only make it stale.
+    etag = version_etag(*await db.read_versions('tasks'))
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+
+    tasks, next_key = await db.read_tasks(completed, limit, decode_cursor(cursor))
+    response.headers['ETag'] = etag
+    if next_key is not None:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(next_key)
+    return tasks
+
+
+@router.get(
+    '/export',
+    summary='Exports task list',
+    description='Streams the whole task list as newline-delimited JSON, '
+                'one task per line.',
+    response_class=StreamingResponse,
+)
+async def export_tasks(completed: bool = None, db: AsyncDBSession = Depends(get_db)):
+    batches = await db.export_tasks(completed, EXPORT_BATCH_SIZE)
+
+    async def lines():
+        async for batch in db.iterate(batches):
+            yield ''.join(json.dumps(task) + '\n' for task in batch)
+
+    return StreamingResponse(lines(), media_type='application/x-ndjson')
 
 
 @router.post(
@@ -27,8 +68,30 @@ async def read_tasks(completed: bool = None, db: DBSession = Depends(get_db)):
     description='Creates a new task and returns its UUID.',
     response_model=uuid.UUID,
 )
-async def create_task(item: Task, db: DBSession = Depends(get_db)):
-    return db.create_task(item)
+async def create_task(item: Task, db: AsyncDBSession = Depends(get_db)):
+    return await db.create_task(item)
+
+
+@router.post(
+    '/batch',
+    summary='Creates several tasks',
+    description='Creates a list of tasks in a single transaction and returns '
+                'their UUIDs, in the same order.',
+    response_model=List[uuid.UUID],
+)
+async def create_tasks(
+        items: List[Task],
+        db: AsyncDBSession = Depends(get_db),
+        settings: dict = Depends(get_settings),
+):
+    if len(items) > settings['max_batch_size']:
+        raise HTTPException(
+            status_code=413,
+            detail=f'Too many tasks, at most {settings["max_batch_size"]} per batch',
+        )
+    if not items:
+        return []
+    return await db.create_tasks(items)
 
 
 @router.get(
@@ -37,15 +100,26 @@ async def create_task(item: Task, db: DBSession = Depends(get_db)):
     description='Reads task from UUID.',
     response_model=Task,
 )
-async def read_task(uuid_: uuid.UUID, db: DBSession = Depends(get_db)):
+async def read_task(
+        uuid_: uuid.UUID,
+        response: Response,
+        if_none_match: str = Header(None),
+        db: AsyncDBSession = Depends(get_db),
+):
     try:
-        return db.read_task(uuid_)
+        task, version = await db.read_task_with_version(uuid_)
     except KeyError as exception:
         raise HTTPException(
             status_code=404,
             detail='Task not found',
         ) from exception
 
+    etag = row_etag(version)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    response.headers['ETag'] = etag
+    return task
+
 
 @router.put(
     '/{uuid_}',
@@ -55,10 +129,10 @@ async def read_task(uuid_: uuid.UUID, db: DBSession = Depends(get_db)):
 async def replace_task(
         uuid_: uuid.UUID,
         item: Task,
-        db: DBSession = Depends(get_db),
+        db: AsyncDBSession = Depends(get_db),
 ):
     try:
-        db.replace_task(uuid_, item)
+        await db.replace_task(uuid_, item)
     except KeyError as exception:
         raise HTTPException(
             status_code=404,
@@ -69,23 +143,59 @@ async def replace_task(
 @router.patch(
     '/{uuid_}',
     summary='Alters task',
-    description='Alters a task identified by its UUID',
+    description='Alters the fields sent of a task identified by its UUID. '
+                'With an `If-Match` header holding the ETag read earlier, '
+                'fails with 409 if the task was modified since.',
 )
 async def alter_task(
         uuid_: uuid.UUID,
         item: Task,
-        db: DBSession = Depends(get_db),
+        response: Response,
+        if_match: str = Header(None),
+        db: AsyncDBSession = Depends(get_db),
 ):
     try:
-        old_item = db.read_task(uuid_)
-        update_data = item.dict(exclude_unset=True)
-        new_item = old_item.copy(update=update_data)
-        db.replace_task(uuid_, new_item)
+        version = await db.alter_task(
+            uuid_,
+            item.dict(exclude_unset=True),
+            if_match_version(if_match),
+        )
     except KeyError as exception:
         raise HTTPException(
             status_code=404,
             detail='Task not found',
         ) from exception
+    except VersionConflict as exception:
+        raise HTTPException(
+            status_code=409,
+            detail='Task was modified, read it again before altering it',
+            headers={'ETag': row_etag(exception.current_version)},
+        ) from exception
+
+    if version is not None:
+        response.headers['ETag'] = row_etag(version)
+
+
+@router.patch(
+    '',
+    summary='Alters tasks matching a filter',
+    description='Alters every task matching the filters with the fields sent '
+                'in the body, and returns how many tasks matched.',
+    response_model=int,
+)
+async def alter_tasks(
+        item: Task,
+        completed: bool = None,
+        user_id: uuid.UUID = None,
+        db: AsyncDBSession = Depends(get_db),
+        settings: dict = Depends(get_settings),
+):
+    return await db.alter_tasks(
+        item.dict(exclude_unset=True),
+        completed,
+        user_id,
+        settings['bulk_chunk_size'],
+    )
 
 
 @router.delete(
@@ -93,9 +203,9 @@ async def alter_task(
     summary='Deletes task',
     description='Deletes a task identified by its UUID',
 )
-async def remove_task(uuid_: uuid.UUID, db: DBSession = Depends(get_db)):
+async def remove_task(uuid_: uuid.UUID, db: AsyncDBSession = Depends(get_db)):
     try:
-        db.remove_task(uuid_)
+        await db.remove_task(uuid_)
     except KeyError as exception:
         raise HTTPException(
             status_code=404,
@@ -105,8 +215,17 @@ async def remove_task(uuid_: uuid.UUID, db: DBSession = Depends(get_db)):
 
 @router.delete(
     '',
-    summary='Deletes all tasks, use with caution',
-    description='Deletes all tasks, use with caution',
+    summary='Deletes tasks, use with caution',
+    description='Deletes all tasks, or only those matching the filters, and '
+                'returns how many were deleted. Use with caution',
+    response_model=int,
 )
-async def remove_all_tasks(db: DBSession = Depends(get_db)):
-    db.remove_all_tasks()
+async def remove_tasks(
+        completed: bool = None,
+        user_id: uuid.UUID = None,
+        db: AsyncDBSession = Depends(get_db),
+        settings: dict = Depends(get_settings),
+):
+    if completed is None and user_id is None:
+        return await db.remove_all_tasks()
+    return await db.remove_tasks(completed, user_id, settings['bulk_chunk_size'])
@@ -3,22 +3,40 @@ import uuid
 
 from typing import Dict
 
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Response
 
-from ..database import DBSession, get_db
-from ..models import User
+from ..database import AsyncDBSession, UnitOfWorkRoute, VersionConflict, get_db
+from ..etag import etag_matches, if_match_version, not_modified, row_etag, version_etag
+from ..models import Task, User
+from ..pagination import MAX_PAGE_SIZE, NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
 
-router = APIRouter()
+router = APIRouter(route_class=UnitOfWorkRoute)
 
 
 @router.get(
     '',
     summary='Reads user list',
-    description='Reads the whole user list.',
+    description='Reads the user list. When `limit` is given, reads one page '
+                'of it; the cursor of the next page, if any, is returned in '
+                f'the `{NEXT_CURSOR_HEADER}` header.',
     response_model=Dict[uuid.UUID, User],
 )
-async def read_users(db: DBSession = Depends(get_db)):
-    return db.read_users()
+async def read_users(
+        response: Response,
+        limit: int = Query(None, ge=1, le=MAX_PAGE_SIZE),
+        cursor: str = None,
+        if_none_match: str = Header(None),
+        db: AsyncDBSession = Depends(get_db),
+):
+    etag = version_etag(*await db.read_versions('users'))
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+
+    users, next_key = await db.read_users(limit, decode_cursor(cursor))
+    response.headers['ETag'] = etag
+    if next_key is not None:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(next_key)
+    return users
 
 
 @router.post(
@@ -27,8 +45,8 @@ async def read_users(db: DBSession = Depends(get_db)):
     description='Creates a new user and returns its UUID.',
     response_model=uuid.UUID,
 )
-async def create_user(item: User, db: DBSession = Depends(get_db)):
-    return db.create_user(item)
+async def create_user(item: User, db: AsyncDBSession = Depends(get_db)):
+    return await db.create_user(item)
 
 
 @router.get(
@@ -37,15 +55,65 @@ async def create_user(item: User, db: DBSession = Depends(get_db)):
     description='Reads user from UUID.',
     response_model=User,
 )
-async def read_user(uuid_: uuid.UUID, db: DBSession = Depends(get_db)):
+async def read_user(
+        uuid_: uuid.UUID,
+        response: Response,
+        if_none_match: str = Header(None),
+        db: AsyncDBSession = Depends(get_db),
+):
     try:
-        return db.read_user(uuid_)
+        user, version = await db.read_user_with_version(uuid_)
     except KeyError as exception:
         raise HTTPException(
             status_code=404,
             detail='user not found',
         ) from exception
 
+    etag = row_etag(version)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    response.headers['ETag'] = etag
+    return user
+
+
+@router.get(
+    '/{uuid_}/tasks',
+    summary='Reads user tasks',
+    description='Reads the tasks of a user, optionally filtered by completion. '
+                'Accepts the same `limit` and `cursor` parameters as the task '
+                'list.',
+    response_model=Dict[uuid.UUID, Task],
+)
+async def read_user_tasks(
+        uuid_: uuid.UUID,
+        response: Response,
+        completed: bool = None,
+        limit: int = Query(None, ge=1, le=MAX_PAGE_SIZE),
+        cursor: str = None,
+        if_none_match: str = Header(None),
+        db: AsyncDBSession = Depends(get_db),
+):
+    etag = version_etag(*await db.read_versions('users', 'tasks'))
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+
+    try:
+        tasks, next_key = await db.read_user_tasks(
+            uuid_,
+            completed,
+            limit,
+            decode_cursor(cursor),
+        )
+    except KeyError as exception:
+        raise HTTPException(
+            status_code=404,
+            detail='User not found',
+        ) from exception
+    response.headers['ETag'] = etag
+    if next_key is not None:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(next_key)
+    return tasks
+
 
 @router.put(
     '/{uuid_}',
@@ -55,10 +123,10 @@ async def read_user(uuid_: uuid.UUID, db: DBSession = Depends(get_db)):
 async def replace_user(
         uuid_: uuid.UUID,
         item: User,
-        db: DBSession = Depends(get_db),
+        db: AsyncDBSession = Depends(get_db),
 ):
     try:
-        db.replace_user(uuid_, item)
+        await db.replace_user(uuid_, item)
     except KeyError as exception:
         raise HTTPException(
             status_code=404,
@@ -69,23 +137,37 @@ async def replace_user(
 @router.patch(
     '/{uuid_}',
     summary='Alters user',
-    description='Alters a user identified by its UUID',
+    description='Alters the fields sent of a user identified by its UUID. '
+                'With an `If-Match` header holding the ETag read earlier, '
+                'fails with 409 if the user was modified since.',
 )
 async def alter_user(
         uuid_: uuid.UUID,
         item: User,
-        db: DBSession = Depends(get_db),
+        response: Response,
+        if_match: str = Header(None),
+        db: AsyncDBSession = Depends(get_db),
 ):
     try:
-        old_item = db.read_user(uuid_)
-        update_data = item.dict(exclude_unset=True)
-        new_item = old_item.copy(update=update_data)
-        db.replace_user(uuid_, new_item)
+        version = await db.alter_user(
+            uuid_,
+            item.dict(exclude_unset=True),
+            if_match_version(if_match),
+        )
     except KeyError as exception:
         raise HTTPException(
             status_code=404,
             detail='User not found',
         ) from exception
+    except VersionConflict as exception:
+        raise HTTPException(
+            status_code=409,
+            detail='User was modified, read it again before altering it',
+            headers={'ETag': row_etag(exception.current_version)},
+        ) from exception
+
+    if version is not None:
+        response.headers['ETag'] = row_etag(version)
 
 
 @router.delete(
@@ -93,9 +175,9 @@ async def alter_user(
     summary='Deletes user',
     description='Deletes a user identified by its UUID',
 )
-async def remove_user(uuid_: uuid.UUID, db: DBSession = Depends(get_db)):
+async def remove_user(uuid_: uuid.UUID, db: AsyncDBSession = Depends(get_db)):
     try:
-        db.remove_user(uuid_)
+        await db.remove_user(uuid_)
     except KeyError as exception:
         raise HTTPException(
             status_code=404,
@@ -108,5 +190,5 @@ async def remove_user(uuid_: uuid.UUID, db: DBSession = Depends(get_db)):
     summary='Deletes all users, use with caution',
     description='Deletes all users, use with caution',
 )
-async def remove_all_users(db: DBSession = Depends(get_db)):
-    db.remove_all_users()
+async def remove_all_users(db: AsyncDBSession = Depends(get_db)):
+    await db.remove_all_users()
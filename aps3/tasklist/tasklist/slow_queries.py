@@ -0,0 +1,133 @@
+# pylint: disable=missing-module-docstring
+import collections
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+class SlowQueryLog:
+    '''Records statements that took at least `threshold` seconds.
+
+    Each entry holds the statement's name and SQL, the shape of its
+    parameters (never their values), its duration, the rows it fetched or
+    affected and its EXPLAIN plan. The plan is captured in the background,
+    on a side connection opened with `backend`, so the slow request does not
+    get any slower. Entries are appended as JSON lines to a rotating log
+    file at `path` and the latest `max_entries` are kept for `recent`.
+    '''
+
+    def __init__(
+            self,
+            threshold: float,
+            backend,
+            path: str = None,
+            max_bytes: int = 10 * 1024 * 1024,
+            backup_count: int = 5,
+            max_entries: int = 1000,
+    ):
+        self.threshold = threshold
+        self.backend = backend
+        self._entries = collections.deque(maxlen=max_entries)
+        self._lock = threading.Lock()
+        self._connection = None
+        # A single thread, so the side connection is never shared.
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='tasklist-explain')
+
+        self._logger = logging.Logger('tasklist.slow_queries')
+        self._handler = None
+        if path is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._handler = logging.handlers.RotatingFileHandler(
+                path,
+                maxBytes=max_bytes,
+                backupCount=backup_count,
+                encoding='utf-8',
+            )
+            self._logger.addHandler(self._handler)
+
+    def record(self, statement, query, params, many, seconds, rows):
+        '''Takes a finished statement, as reported by TimedCursor.'''
+        if seconds < self.threshold:
+            return
+        entry = {
+            'time': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'statement': statement,
+            'query': query,
+            'params': params_shape(params, many),
+            'seconds': seconds,
+            'rows': rows,
+        }
+        self._executor.submit(self._explain_and_log, entry, query, params, many)
+
+    def recent(self, limit: int = None):
+        '''The latest entries, newest first.'''
+        with self._lock:
+            entries = list(reversed(self._entries))
+        return entries if limit is None else entries[:limit]
+
+    def flush(self):
+        '''Waits until every entry recorded so far has been logged.'''
+        self._executor.submit(lambda: None).result()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+        if self._handler is not None:
+            self._logger.removeHandler(self._handler)
+            self._handler.close()
+
+    def _explain_and_log(self, entry, query, params, many):
+        if many:
+            # One set of parameters per row, nothing worth explaining
+            entry['explain'] = None
+        else:
+            try:
+                if self._connection is None:
+                    self._connection = self.backend.connect()
+                entry['explain'] = self.backend.explain(self._connection, query, params)
+            except Exception as exception:  # pylint: disable=broad-except
+                entry['explain'] = None
+                entry['explain_error'] = str(exception)
+                self._drop_connection()
+
+        with self._lock:
+            self._entries.append(entry)
+        self._logger.warning(json.dumps(entry, default=str))
+
+    def _drop_connection(self):
+        # The plan of some statements cannot be explained, but the connection
+        # may also be broken: start over with a new one next time.
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except Exception:  # pylint: disable=broad-except
+                pass
+            self._connection = None
+
+
+def params_shape(params, many=False):
+    '''Types (and sizes) of `params`, so they can be logged without their values.'''
+    if params is None:
+        return None
+    if many:
+        params = list(params)
+        return {
+            'rows': len(params),
+            'row': params_shape(params[0]) if params else None,
+        }
+    return [_shape(param) for param in params]
+
+
+def _shape(value):
+    if value is None:
+        return 'null'
+    if isinstance(value, (str, bytes, bytearray)):
+        return f'{type(value).__name__}[{len(value)}]'
+    return type(value).__name__
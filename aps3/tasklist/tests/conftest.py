@@ -0,0 +1,84 @@
+# pylint: disable=missing-module-docstring,missing-function-docstring
+import json
+import os
+import os.path
+
+import pytest
+
+from utils import utils
+
+from tasklist.main import app
+
+
+def get_worker_name():
+    '''The pytest-xdist worker running this process (gw0, gw1...), None if serial.'''
+    return os.environ.get('PYTEST_XDIST_WORKER')
+
+
+def create_database(name):
+    # From the shared test database, which the admin user can always reach
+    backend = utils.get_backend(
+        utils.get_config_test_filename(),
+        utils.get_admin_secrets_filename(),
+    )
+    conn = backend.connect()
+    try:
+        backend.run_script(conn, f'CREATE DATABASE IF NOT EXISTS {name};')
+    finally:
+        conn.close()
+
+
+@pytest.fixture(scope='session')
+def config_test_filename(tmp_path_factory):
+    '''Config of the test database of this worker, migrated once.
+
+    Each worker gets its own SQLite file, or its own MySQL database named
+    after it, so workers never see each other's rows.
+    '''
+    with open(utils.get_config_test_filename(), 'r') as file:
+        config = json.load(file)
+
+    directory = tmp_path_factory.mktemp('config')
+    worker = get_worker_name()
+    if config.get('backend', 'mysql') == 'sqlite':
+        config['sqlite_path'] = os.fspath(directory / 'tasklist_test.sqlite3')
+    elif worker is not None:
+        config['database'] = f'{config["database"]}_{worker}'
+        create_database(config['database'])
+    if config.get('slow_query_log') is not None:
+        config['slow_query_log'] = os.fspath(directory / 'slow_queries_test.log')
+
+    filename = os.fspath(directory / 'config_test.json')
+    with open(filename, 'w') as file:
+        json.dump(config, file, indent=4)
+
+    scripts_dir = os.path.join(
+        os.path.dirname(__file__),
+        '..',
+        'database',
+        'migrations',
+    )
+    utils.run_all_scripts(scripts_dir, filename, utils.get_admin_secrets_filename())
+    return filename
+
+
+@pytest.fixture(scope='session', autouse=True)
+def use_test_database(config_test_filename):
+    app.dependency_overrides[utils.get_config_filename] = lambda: config_test_filename
+    yield
+    del app.dependency_overrides[utils.get_config_filename]
+
+
+@pytest.fixture
+def empty_database(config_test_filename):
+    backend = utils.get_backend(config_test_filename, utils.get_admin_secrets_filename())
+    conn = backend.connect()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute('DELETE FROM tasks')
+            cursor.execute('DELETE FROM users')
+            # Bumped rather than reset, so no ETag of an earlier test matches.
+            cursor.execute('UPDATE table_versions SET version = version + 1')
+        conn.commit()
+    finally:
+        conn.close()
@@ -1,41 +1,33 @@
 # pylint: disable=missing-module-docstring,missing-function-docstring
+import asyncio
+import json
 import os.path
+import time
+
+import pytest
 
 from fastapi.testclient import TestClient
 
+from benchmarks import asgi
 from utils import utils
 
+from tasklist import database
+from tasklist.cache import LRUCache
 from tasklist.main import app
+from tasklist.models import Task
 
 client = TestClient(app)
 
-app.dependency_overrides[utils.get_config_filename] = \
-    utils.get_config_test_filename
-
-
-def setup_database():
-    scripts_dir = os.path.join(
-        os.path.dirname(__file__),
-        '..',
-        'database',
-        'migrations',
-    )
-    config_test_file_name = utils.get_config_filename()
-    config_file_name = utils.get_config_filename()
-    secrets_file_name = utils.get_admin_secrets_filename()
-    utils.run_all_scripts(scripts_dir, config_test_file_name, secrets_file_name)
-    # utils.run_all_scripts(scripts_dir, config_file_name, secrets_file_name)
+pytestmark = pytest.mark.usefixtures('empty_database')
 
 
 def test_read_main_returns_not_found():
-    setup_database()
     response = client.get('/')
     assert response.status_code == 404
     assert response.json() == {'detail': 'Not Found'}
 
 
 def test_read_tasks_with_no_task():
-    setup_database()
     response = client.delete('/task')
     assert response.status_code == 200
     response = client.get('/task')
@@ -44,8 +36,6 @@ def test_read_tasks_with_no_task():
 
 
 def test_create_and_read_some_tasks():
-    setup_database()
-
     #Create user
     user = {
         "username": "gabilu",
@@ -142,8 +132,6 @@ def test_create_and_read_some_tasks():
 
 
 def test_substitute_task():
-    setup_database()
-
     # Create a task.
     task = {'description': 'foo', 'completed': False, 'user_id': None}
     response = client.post('/task', json=task)
@@ -170,8 +158,6 @@ def test_substitute_task():
 
 
 def test_alter_task():
-    setup_database()
-
     # Create a task.
     task = {'description': 'foo', 'completed': False, 'user_id': None}
     response = client.post('/task', json=task)
@@ -194,36 +180,26 @@ def test_alter_task():
 
 
 def test_read_invalid_task():
-    setup_database()
-
     response = client.get('/task/invalid_uuid')
     assert response.status_code == 422
 
 
 def test_read_nonexistant_task():
-    setup_database()
-
     response = client.get('/task/3668e9c9-df18-4ce2-9bb2-82f907cf110c')
     assert response.status_code == 404
 
 
 def test_delete_invalid_task():
-    setup_database()
-
     response = client.delete('/task/invalid_uuid')
     assert response.status_code == 422
 
 
 def test_delete_nonexistant_task():
-    setup_database()
-
     response = client.delete('/task/3668e9c9-df18-4ce2-9bb2-82f907cf110c')
     assert response.status_code == 404
 
 
 def test_delete_all_tasks():
-    setup_database()
-
     # Create a task.
     task = {'description': 'foo', 'completed': False, 'user_id': None}
     response = client.post('/task', json=task)
@@ -241,8 +217,6 @@ def test_delete_all_tasks():
 
 
 def test_substitute_user():
-    setup_database()
-
     # Create a user.
     user = {'username': 'luiza'}
     response = client.post('/user', json=user)
@@ -264,8 +238,6 @@ def test_substitute_user():
     assert response.status_code == 200
 
 def test_alter_user():
-    setup_database()
-
     # Create a user.
     user = {'username': 'luiza'}
     response = client.post('/user', json=user)
@@ -287,13 +259,532 @@ def test_alter_user():
     assert response.status_code == 200
 
 def test_read_nonexistant_user():
-    setup_database()
-
     response = client.get('/user/invalid_user')
     assert response.status_code == 422
 
 def test_delete_nonexistant_user():
-    setup_database()
-
     response = client.delete('/user/invalid_user')
-    assert response.status_code == 422
\ No newline at end of file
+    assert response.status_code == 422
+
+def test_read_tasks_in_pages():
+    uuids = set()
+    for index in range(5):
+        response = client.post('/task', json={'description': f'task {index}'})
+        assert response.status_code == 200
+        uuids.add(response.json())
+
+    # Walk the list two tasks at a time.
+    pages = []
+    cursor = None
+    while True:
+        url = '/task?limit=2'
+        if cursor is not None:
+            url += f'&cursor={cursor}'
+        response = client.get(url)
+        assert response.status_code == 200
+        pages.append(response.json())
+        cursor = response.headers.get('X-Next-Cursor')
+        if cursor is None:
+            break
+
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert {uuid_ for page in pages for uuid_ in page} == uuids
+
+
+def test_read_tasks_with_invalid_cursor():
+    response = client.get('/task?limit=2&cursor=not-a-cursor')
+    assert response.status_code == 400
+
+
+def test_read_users_in_pages():
+    uuids = set()
+    for index in range(3):
+        response = client.post('/user', json={'username': f'user {index}'})
+        assert response.status_code == 200
+        uuids.add(response.json())
+
+    response = client.get('/user?limit=2')
+    assert response.status_code == 200
+    first_page = response.json()
+    cursor = response.headers['X-Next-Cursor']
+
+    response = client.get(f'/user?limit=2&cursor={cursor}')
+    assert response.status_code == 200
+    assert 'X-Next-Cursor' not in response.headers
+    assert {**first_page, **response.json()}.keys() == uuids
+
+
+def test_export_tasks():
+    tasks = [
+        {'description': 'foo', 'completed': False, 'user_id': None},
+        {'description': 'bar', 'completed': True, 'user_id': None},
+    ]
+    expected = {}
+    for task in tasks:
+        response = client.post('/task', json=task)
+        assert response.status_code == 200
+        expected[response.json()] = task
+
+    response = client.get('/task/export')
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'application/x-ndjson'
+    exported = [json.loads(line) for line in response.text.splitlines()]
+    assert {task.pop('uuid'): task for task in exported} == expected
+
+    response = client.get('/task/export?completed=true')
+    assert response.status_code == 200
+    exported = [json.loads(line) for line in response.text.splitlines()]
+    assert [task['description'] for task in exported] == ['bar']
+
+
+def test_replace_task_with_unchanged_values():
+    task = {'description': 'foo', 'completed': False, 'user_id': None}
+    response = client.post('/task', json=task)
+    assert response.status_code == 200
+    uuid_ = response.json()
+
+    # An UPDATE that changes nothing must not be mistaken for a missing row.
+    response = client.put(f'/task/{uuid_}', json=task)
+    assert response.status_code == 200
+    response = client.patch(f'/task/{uuid_}', json={'completed': False})
+    assert response.status_code == 200
+
+
+def test_replace_nonexistant_task():
+    response = client.put(
+        '/task/3668e9c9-df18-4ce2-9bb2-82f907cf110c',
+        json={'description': 'foo'},
+    )
+    assert response.status_code == 404
+
+
+def test_replace_and_delete_nonexistant_user():
+    response = client.put(
+        '/user/3668e9c9-df18-4ce2-9bb2-82f907cf110c',
+        json={'username': 'foo'},
+    )
+    assert response.status_code == 404
+    response = client.delete('/user/3668e9c9-df18-4ce2-9bb2-82f907cf110c')
+    assert response.status_code == 404
+
+
+def test_create_tasks_in_batch():
+    tasks = [
+        {'description': 'foo', 'completed': False, 'user_id': None},
+        {'description': 'bar', 'completed': True, 'user_id': None},
+        {'description': 'baz', 'completed': False, 'user_id': None},
+    ]
+    response = client.post('/task/batch', json=tasks)
+    assert response.status_code == 200
+    uuids = response.json()
+    assert len(uuids) == len(tasks)
+
+    for uuid_, task in zip(uuids, tasks):
+        response = client.get(f'/task/{uuid_}')
+        assert response.status_code == 200
+        assert response.json() == task
+
+
+def test_create_tasks_in_batch_too_large():
+    response = client.post('/task/batch', json=[{}] * 101)
+    assert response.status_code == 413
+
+    response = client.get('/task')
+    assert response.status_code == 200
+    assert response.json() == {}
+
+
+def test_alter_and_delete_tasks_by_filter():
+    response = client.post('/user', json={'username': 'gabilu'})
+    assert response.status_code == 200
+    user_id = response.json()
+
+    tasks = [
+        {'description': 'foo', 'completed': False, 'user_id': user_id},
+        {'description': 'bar', 'completed': False, 'user_id': user_id},
+        {'description': 'baz', 'completed': True, 'user_id': user_id},
+        {'description': 'qux', 'completed': False, 'user_id': None},
+        {'description': 'quux', 'completed': False, 'user_id': user_id},
+    ]
+    response = client.post('/task/batch', json=tasks)
+    assert response.status_code == 200
+    uuids = response.json()
+
+    # Complete all of the user's pending tasks.
+    response = client.patch(
+        f'/task?user_id={user_id}&completed=false',
+        json={'completed': True},
+    )
+    assert response.status_code == 200
+    assert response.json() == 3
+
+    response = client.get('/task?completed=false')
+    assert response.status_code == 200
+    assert list(response.json()) == [uuids[3]]
+
+    # Clear the completed tasks.
+    response = client.delete('/task?completed=true')
+    assert response.status_code == 200
+    assert response.json() == 4
+
+    response = client.get('/task')
+    assert response.status_code == 200
+    assert list(response.json()) == [uuids[3]]
+
+
+def test_read_user_tasks():
+    response = client.post('/user', json={'username': 'gabilu'})
+    assert response.status_code == 200
+    user_id = response.json()
+
+    # A user without tasks.
+    response = client.get(f'/user/{user_id}/tasks')
+    assert response.status_code == 200
+    assert response.json() == {}
+
+    tasks = [
+        {'description': 'foo', 'completed': False, 'user_id': user_id},
+        {'description': 'bar', 'completed': True, 'user_id': user_id},
+        {'description': 'baz', 'completed': False, 'user_id': None},
+    ]
+    response = client.post('/task/batch', json=tasks)
+    assert response.status_code == 200
+    uuids = response.json()
+
+    response = client.get(f'/user/{user_id}/tasks')
+    assert response.status_code == 200
+    assert response.json() == {uuids[0]: tasks[0], uuids[1]: tasks[1]}
+
+    response = client.get(f'/user/{user_id}/tasks?completed=true')
+    assert response.status_code == 200
+    assert response.json() == {uuids[1]: tasks[1]}
+
+    response = client.get(f'/user/{user_id}/tasks?limit=1')
+    assert response.status_code == 200
+    assert len(response.json()) == 1
+    cursor = response.headers['X-Next-Cursor']
+    response = client.get(f'/user/{user_id}/tasks?limit=1&cursor={cursor}')
+    assert response.status_code == 200
+    assert len(response.json()) == 1
+    assert 'X-Next-Cursor' not in response.headers
+
+
+def test_read_nonexistant_user_tasks():
+    response = client.get('/user/3668e9c9-df18-4ce2-9bb2-82f907cf110c/tasks')
+    assert response.status_code == 404
+
+
+def test_read_task_is_cached_and_invalidated():
+    response = client.post('/task', json={'description': 'foo'})
+    assert response.status_code == 200
+    uuid_ = response.json()
+
+    hits = client.get('/admin/cache').json()['task']['hits']
+    for _ in range(3):
+        response = client.get(f'/task/{uuid_}')
+        assert response.status_code == 200
+    assert client.get('/admin/cache').json()['task']['hits'] == hits + 2
+
+    # Writes must never leave a stale entry behind.
+    response = client.patch(f'/task/{uuid_}', json={'description': 'bar'})
+    assert response.status_code == 200
+    response = client.get(f'/task/{uuid_}')
+    assert response.json()['description'] == 'bar'
+
+    response = client.delete(f'/task/{uuid_}')
+    assert response.status_code == 200
+    response = client.get(f'/task/{uuid_}')
+    assert response.status_code == 404
+
+
+def test_read_tasks_not_modified():
+    response = client.get('/task')
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+
+    response = client.get('/task', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+
+    # Any write changes the list's ETag.
+    response = client.post('/task', json={'description': 'foo'})
+    assert response.status_code == 200
+    uuid_ = response.json()
+
+    response = client.get('/task', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert list(response.json()) == [uuid_]
+
+
+def test_read_task_not_modified():
+    response = client.post('/task', json={'description': 'foo'})
+    assert response.status_code == 200
+    uuid_ = response.json()
+
+    response = client.get(f'/task/{uuid_}')
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+
+    response = client.get(f'/task/{uuid_}', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+    response = client.put(f'/task/{uuid_}', json={'description': 'bar'})
+    assert response.status_code == 200
+
+    response = client.get(f'/task/{uuid_}', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.json()['description'] == 'bar'
+
+
+def test_read_users_not_modified():
+    response = client.get('/user')
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+
+    response = client.get('/user', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+    response = client.post('/user', json={'username': 'gabilu'})
+    assert response.status_code == 200
+
+    response = client.get('/user', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+
+
+def test_alter_task_with_stale_version():
+    response = client.post('/task', json={'description': 'foo'})
+    assert response.status_code == 200
+    uuid_ = response.json()
+
+    response = client.get(f'/task/{uuid_}')
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+
+    response = client.patch(
+        f'/task/{uuid_}',
+        json={'completed': True},
+        headers={'If-Match': etag},
+    )
+    assert response.status_code == 200
+    new_etag = response.headers['ETag']
+    assert new_etag != etag
+
+    # A second writer still holding the old ETag must not overwrite it.
+    response = client.patch(
+        f'/task/{uuid_}',
+        json={'description': 'bar'},
+        headers={'If-Match': etag},
+    )
+    assert response.status_code == 409
+    assert response.headers['ETag'] == new_etag
+
+    response = client.get(f'/task/{uuid_}')
+    assert response.status_code == 200
+    assert response.headers['ETag'] == new_etag
+    assert response.json() == {'description': 'foo', 'completed': True, 'user_id': None}
+
+
+def test_alter_nonexistant_task():
+    response = client.patch(
+        '/task/3668e9c9-df18-4ce2-9bb2-82f907cf110c',
+        json={'completed': True},
+        headers={'If-Match': '"1"'},
+    )
+    assert response.status_code == 404
+
+
+def test_alter_user_with_stale_version():
+    response = client.post('/user', json={'username': 'luiza'})
+    assert response.status_code == 200
+    userid = response.json()
+
+    response = client.patch(
+        f'/user/{userid}',
+        json={'username': 'gabi'},
+        headers={'If-Match': '"1"'},
+    )
+    assert response.status_code == 200
+
+    response = client.patch(
+        f'/user/{userid}',
+        json={'username': 'novo'},
+        headers={'If-Match': '"1"'},
+    )
+    assert response.status_code == 409
+
+
+def test_savepoint_rolls_back_only_nested_writes(config_test_filename):
+    credentials = database.get_credentials(
+        config_test_filename,
+        utils.get_app_secrets_filename(),
+    )
+    settings = database.get_settings(config_test_filename)
+    with database.get_pool(credentials, settings).connection() as connection:
+        session = database.DBSession(connection)
+        kept = session.create_task(Task(description='kept'))
+        with pytest.raises(RuntimeError):
+            with session.savepoint():
+                session.create_task(Task(description='discarded'))
+                raise RuntimeError()
+        session.commit()
+
+    response = client.get('/task')
+    assert response.status_code == 200
+    assert list(response.json()) == [str(kept)]
+
+
+def test_bulk_updates_do_not_commit_a_savepoint(config_test_filename):
+    credentials = database.get_credentials(
+        config_test_filename,
+        utils.get_app_secrets_filename(),
+    )
+    settings = database.get_settings(config_test_filename)
+    with database.get_pool(credentials, settings).connection() as connection:
+        session = database.DBSession(connection)
+        kept = session.create_task(Task(description='kept'))
+        session.commit()
+        with pytest.raises(RuntimeError):
+            with session.savepoint():
+                session.create_task(Task(description='discarded'))
+                assert session.alter_tasks({'completed': True}, chunk_size=1) == 2
+                raise RuntimeError()
+        session.commit()
+
+        # The first write of the session is still committed chunk by chunk.
+        assert session.alter_tasks({'description': 'bulk'}, chunk_size=1) == 1
+        assert not session.dirty
+
+    response = client.get('/task')
+    assert response.status_code == 200
+    assert response.json() == {str(kept): {'description': 'bulk', 'completed': False, 'user_id': None}}
+
+
+def test_uncommitted_reads_are_never_cached(config_test_filename):
+    credentials = database.get_credentials(
+        config_test_filename,
+        utils.get_app_secrets_filename(),
+    )
+    settings = database.get_settings(config_test_filename)
+    task_cache = LRUCache()
+    with database.get_pool(credentials, settings).connection() as connection:
+        session = database.DBSession(connection, task_cache=task_cache)
+        uuid_ = session.create_task(Task(description='committed'))
+        session.commit()
+
+        with pytest.raises(RuntimeError):
+            with session.savepoint():
+                session.alter_task(uuid_, {'description': 'rolled back'})
+                assert session.read_task(uuid_).description == 'rolled back'
+                raise RuntimeError()
+        session.alter_task(uuid_, {'completed': True})
+        assert session.read_task(uuid_).description == 'committed'
+        session.rollback()
+
+    with database.get_pool(credentials, settings).connection() as connection:
+        session = database.DBSession(connection, task_cache=task_cache)
+        task = session.read_task(uuid_)
+        assert (task.description, task.completed) == ('committed', False)
+
+
+def test_versions_are_bumped_once_per_commit(config_test_filename):
+    credentials = database.get_credentials(
+        config_test_filename,
+        utils.get_app_secrets_filename(),
+    )
+    settings = database.get_settings(config_test_filename)
+    with database.get_pool(credentials, settings).connection() as connection:
+        session = database.DBSession(connection)
+        before = session.read_versions('tasks', 'users')
+        session.create_task(Task(description='foo'))
+        session.create_task(Task(description='bar'))
+        assert session.read_versions('tasks', 'users') == before
+        session.commit()
+        assert session.read_versions('tasks', 'users') == (before[0] + 1, before[1])
+
+
+def test_in_memory_database_is_shared(tmp_path):
+    config_file_name = os.fspath(tmp_path / 'config.json')
+    with open(config_file_name, 'w') as file:
+        json.dump({'backend': 'sqlite'}, file)
+    scripts_dir = os.path.join(os.path.dirname(__file__), '..', 'database', 'migrations')
+    utils.run_all_scripts(scripts_dir, config_file_name, None)
+
+    override = app.dependency_overrides[utils.get_config_filename]
+    app.dependency_overrides[utils.get_config_filename] = lambda: config_file_name
+    try:
+        response = client.post('/task', json={'description': 'in memory'})
+        assert response.status_code == 200
+        response = client.get('/task')
+        assert response.status_code == 200
+        assert [task['description'] for task in response.json().values()] == ['in memory']
+    finally:
+        app.dependency_overrides[utils.get_config_filename] = override
+
+
+def test_pool_is_opened_at_startup(config_test_filename, monkeypatch):
+    credentials = database.get_credentials(
+        config_test_filename,
+        utils.get_app_secrets_filename(),
+    )
+    settings = database.get_settings(config_test_filename)
+    database.close_pools()
+    with TestClient(app) as started_client:
+        # From now on, creating a pool fails.
+        monkeypatch.setattr(database, 'ConnectionPool', None)
+        pool = database.get_pool(credentials, settings)
+        assert pool.size >= settings['pool_min_size']
+        response = started_client.get('/task')
+        assert response.status_code == 200
+
+
+def test_waiting_for_a_connection_does_not_hold_up_other_requests(tmp_path):
+    config_file_name = os.fspath(tmp_path / 'config.json')
+    with open(config_file_name, 'w') as file:
+        json.dump({'backend': 'sqlite', 'sqlite_path': 'tasklist.sqlite3', 'pool_max_size': 2}, file)
+    scripts_dir = os.path.join(os.path.dirname(__file__), '..', 'database', 'migrations')
+    utils.run_all_scripts(scripts_dir, config_file_name, None)
+    pool = database.get_pool(
+        database.get_credentials(config_file_name, utils.get_app_secrets_filename()),
+        database.get_settings(config_file_name),
+    )
+    held = [pool.acquire() for _ in range(pool.max_size)]
+
+    async def scrape_while_waiting():
+        waiting = [asyncio.ensure_future(asgi.request(app, 'GET', '/task')) for _ in range(20)]
+        await asyncio.sleep(0.1)
+        start = time.perf_counter()
+        response = await asgi.request(app, 'GET', '/metrics')
+        elapsed = time.perf_counter() - start
+        for connection in held:
+            pool.release(connection)
+        return response, elapsed, await asyncio.gather(*waiting)
+
+    override = app.dependency_overrides[utils.get_config_filename]
+    app.dependency_overrides[utils.get_config_filename] = lambda: config_file_name
+    try:
+        response, elapsed, responses = asyncio.run(scrape_while_waiting())
+    finally:
+        app.dependency_overrides[utils.get_config_filename] = override
+    assert response.status_code == 200
+    assert elapsed < 1.0
+    assert {response.status_code for response in responses} == {200}
+
+
+def test_metrics_expose_statements_and_routes():
+    assert client.get('/task').status_code == 200
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/plain; version=0.0.4')
+    text = response.text
+    assert 'tasklist_db_statement_seconds_count{statement="read_tasks"}' in text
+    assert 'tasklist_db_statement_rows_bucket{statement="read_tasks",le="0.0"}' in text
+    assert 'tasklist_db_pool_wait_seconds_count ' in text
+    assert 'tasklist_http_request_seconds_count{method="GET",route="/task",status="200"}' in text
+
+
+def test_read_slow_queries():
+    response = client.get('/admin/slow-queries?limit=10')
+    assert response.status_code == 200
+    assert isinstance(response.json(), list)
@@ -0,0 +1,134 @@
+# pylint: disable=missing-module-docstring,missing-function-docstring
+import json
+import os
+import uuid
+
+import pytest
+
+from utils import utils
+
+from tasklist.backends import SQLiteBackend
+
+
+def test_sqlite_backend_speaks_the_mysql_dialect():
+    backend = SQLiteBackend(':memory:')
+    connection = backend.connect()
+    backend.run_script(connection, 'CREATE TABLE things (uuid BINARY(16) PRIMARY KEY);')
+
+    uuid_ = uuid.uuid4()
+    with connection.cursor() as cursor:
+        cursor.execute('INSERT INTO things VALUES (UUID_TO_BIN(%s))', (str(uuid_), ))
+    connection.commit()
+
+    other = backend.connect()
+    with other.cursor() as cursor:
+        cursor.execute('SELECT BIN_TO_UUID(uuid) FROM things')
+        assert cursor.fetchall() == [(str(uuid_), )]
+    assert backend.ping(other)
+
+
+def test_sqlite_backend_rolls_back_uncommitted_writes():
+    backend = SQLiteBackend(':memory:')
+    connection = backend.connect()
+    backend.run_script(connection, 'CREATE TABLE things (id INTEGER PRIMARY KEY);')
+
+    with connection.cursor() as cursor:
+        cursor.execute('INSERT INTO things VALUES (%s)', (1, ))
+    backend.reset(connection)
+
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT COUNT(*) FROM things')
+        assert cursor.fetchone() == (0, )
+
+
+def test_script_filenames_prefer_backend_overrides(tmp_path):
+    for filename in ('0001_a.sql', '0002_b.sql', '0002_b.sqlite.sql', '0003_c.mysql.sql', 'notes.txt'):
+        (tmp_path / filename).write_text('')
+
+    scripts_dir = os.fspath(tmp_path)
+    assert utils.get_script_filenames(scripts_dir, 'sqlite') == ['0001_a.sql', '0002_b.sqlite.sql']
+    assert utils.get_script_filenames(scripts_dir, 'mysql') == ['0001_a.sql', '0002_b.sql', '0003_c.mysql.sql']
+
+
+def test_run_all_scripts_only_runs_new_scripts(tmp_path):
+    config_file_name = os.fspath(tmp_path / 'config.json')
+    with open(config_file_name, 'w') as file:
+        json.dump({'backend': 'sqlite', 'sqlite_path': 'tasklist.sqlite3'}, file)
+    scripts_dir = tmp_path / 'migrations'
+    scripts_dir.mkdir()
+    (scripts_dir / '0001_a.sql').write_text('DROP TABLE IF EXISTS things; CREATE TABLE things (id INTEGER);')
+    (scripts_dir / '0002_b.sql').write_text('INSERT INTO things VALUES (1);')
+
+    assert utils.run_all_scripts(os.fspath(scripts_dir), config_file_name, None) == ['0001_a', '0002_b']
+    (scripts_dir / '0003_c.sql').write_text('INSERT INTO things VALUES (3);')
+    assert utils.run_all_scripts(os.fspath(scripts_dir), config_file_name, None) == ['0003_c']
+
+    connection = utils.get_backend(config_file_name, None).connect()
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT id FROM things ORDER BY id')
+        assert cursor.fetchall() == [(1, ), (3, )]
+
+
+def test_run_all_scripts_from_baseline(tmp_path):
+    config_file_name = os.fspath(tmp_path / 'config.json')
+    with open(config_file_name, 'w') as file:
+        json.dump({'backend': 'sqlite', 'sqlite_path': 'tasklist.sqlite3'}, file)
+    scripts_dir = tmp_path / 'migrations'
+    scripts_dir.mkdir()
+    (scripts_dir / '0001_a.sql').write_text('CREATE TABLE things (id INTEGER);')
+    (scripts_dir / '0002_b.sql').write_text('CREATE TABLE others (id INTEGER);')
+
+    assert utils.run_all_scripts(os.fspath(scripts_dir), config_file_name, None, baseline='0001_a') == ['0002_b']
+    assert utils.run_all_scripts(os.fspath(scripts_dir), config_file_name, None) == []
+
+
+def test_run_all_scripts_refuses_untracked_databases(tmp_path):
+    config_file_name = os.fspath(tmp_path / 'config.json')
+    with open(config_file_name, 'w') as file:
+        json.dump({'backend': 'sqlite', 'sqlite_path': 'tasklist.sqlite3'}, file)
+    scripts_dir = tmp_path / 'migrations'
+    scripts_dir.mkdir()
+    (scripts_dir / '0001_a.sql').write_text('DROP TABLE IF EXISTS things; CREATE TABLE things (id INTEGER);')
+
+    # Migrated before migrations were tracked
+    backend = utils.get_backend(config_file_name, None)
+    connection = backend.connect()
+    backend.run_script(connection, 'CREATE TABLE things (id INTEGER); INSERT INTO things VALUES (1);')
+
+    with pytest.raises(ValueError):
+        utils.run_all_scripts(os.fspath(scripts_dir), config_file_name, None)
+    assert utils.run_all_scripts(os.fspath(scripts_dir), config_file_name, None, baseline='0001_a') == []
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT id FROM things')
+        assert cursor.fetchall() == [(1, )]
+
+
+def test_user_tasks_are_read_in_index_order():
+    backend = SQLiteBackend(':memory:')
+    connection = backend.connect()
+    scripts_dir = os.path.join(os.path.dirname(__file__), '..', 'database', 'migrations')
+    for filename in utils.get_script_filenames(scripts_dir, backend.name):
+        with open(os.path.join(scripts_dir, filename), 'r') as file:
+            backend.run_script(connection, file.read())
+
+    user_id = str(uuid.uuid4())
+    plans = [
+        backend.explain(
+            connection,
+            '''
+            SELECT BIN_TO_UUID(tasks.uuid), tasks.description FROM users
+            LEFT JOIN tasks ON tasks.user_id = users.uuid
+            WHERE users.uuid = UUID_TO_BIN(%s) ORDER BY tasks.uuid LIMIT %s
+            ''',
+            (user_id, 10),
+        ),
+        backend.explain(
+            connection,
+            'SELECT uuid FROM tasks WHERE user_id = UUID_TO_BIN(%s) ORDER BY uuid LIMIT 1 OFFSET %s',
+            (user_id, 9),
+        ),
+    ]
+    for plan in plans:
+        details = [step['detail'] for step in plan]
+        assert any('tasks_user_id ' in detail for detail in details), details
+        assert not any('TEMP B-TREE' in detail for detail in details), details
@@ -0,0 +1,67 @@
+# pylint: disable=missing-module-docstring,missing-function-docstring
+from tasklist.cache import LRUCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_cache_hits_and_misses():
+    cache = LRUCache(max_size=2, ttl=10)
+
+    assert cache.get('a') is None
+    cache.put('a', 1, cache.generation)
+    assert cache.get('a') == 1
+
+    stats = cache.stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+    assert stats['size'] == 1
+
+
+def test_cache_evicts_least_recently_used():
+    cache = LRUCache(max_size=2, ttl=10)
+    for key in 'abc':
+        if key == 'c':
+            assert cache.get('a') == 1
+        cache.put(key, ord(key) - ord('a') + 1, cache.generation)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.stats()['evictions'] == 1
+
+
+def test_cache_entries_expire():
+    clock = FakeClock()
+    cache = LRUCache(max_size=2, ttl=10, clock=clock)
+    cache.put('a', 1, cache.generation)
+
+    clock.now = 9.9
+    assert cache.get('a') == 1
+    clock.now = 10
+    assert cache.get('a') is None
+    assert cache.stats()['expirations'] == 1
+
+
+def test_cache_ignores_values_loaded_before_invalidation():
+    cache = LRUCache(max_size=2, ttl=10)
+
+    generation = cache.generation
+    cache.invalidate('a')
+    cache.put('a', 'stale', generation)
+    assert cache.get('a') is None
+
+    cache.put('a', 1, cache.generation)
+    cache.clear()
+    assert cache.get('a') is None
+
+
+def test_disabled_cache_stores_nothing():
+    cache = LRUCache(max_size=0)
+    cache.put('a', 1, cache.generation)
+    assert cache.get('a') is None
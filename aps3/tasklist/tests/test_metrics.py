@@ -0,0 +1,49 @@
+# pylint: disable=missing-module-docstring,missing-function-docstring
+from tasklist.backends import SQLiteBackend
+from tasklist.metrics import DB_STATEMENT_ROWS, DB_STATEMENT_SECONDS, Histogram, TimedCursor
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram('test_seconds', 'Test histogram.', ('name', ), buckets=(0.1, 1.0), register=False)
+    histogram.observe(0.05, name='a')
+    histogram.observe(0.5, name='a')
+    histogram.observe(5, name='a')
+    histogram.observe(0.1, name='b"c')
+
+    assert histogram.render() == [
+        '# HELP test_seconds Test histogram.',
+        '# TYPE test_seconds histogram',
+        'test_seconds_bucket{name="a",le="0.1"} 1',
+        'test_seconds_bucket{name="a",le="1.0"} 2',
+        'test_seconds_bucket{name="a",le="+Inf"} 3',
+        'test_seconds_sum{name="a"} 5.55',
+        'test_seconds_count{name="a"} 3',
+        'test_seconds_bucket{name="b\\"c",le="0.1"} 1',
+        'test_seconds_bucket{name="b\\"c",le="1.0"} 1',
+        'test_seconds_bucket{name="b\\"c",le="+Inf"} 1',
+        'test_seconds_sum{name="b\\"c"} 0.1',
+        'test_seconds_count{name="b\\"c"} 1',
+    ]
+
+
+def series(histogram, statement):
+    # pylint: disable=protected-access
+    return dict(histogram._series.get((statement, ), {'sum': 0.0, 'count': 0}))
+
+
+def test_timed_cursor_records_each_statement():
+    backend = SQLiteBackend(':memory:')
+    connection = backend.connect()
+    backend.run_script(connection, 'CREATE TABLE things (id INTEGER PRIMARY KEY);')
+    before = series(DB_STATEMENT_ROWS, 'test_things')
+
+    with TimedCursor(connection.cursor(), 'test_things') as cursor:
+        cursor.executemany('INSERT INTO things VALUES (%s)', [(1, ), (2, ), (3, )])
+        cursor.execute('SELECT id FROM things')
+        assert cursor.fetchone() == (1, )
+        assert cursor.fetchall() == [(2, ), (3, )]
+
+    after = series(DB_STATEMENT_ROWS, 'test_things')
+    assert after['count'] - before['count'] == 2
+    assert after['sum'] - before['sum'] == 6
+    assert series(DB_STATEMENT_SECONDS, 'test_things')['count'] >= 2
@@ -0,0 +1,279 @@
+# pylint: disable=missing-module-docstring,missing-function-docstring
+import json
+import os
+import random
+import threading
+
+import pytest
+
+from utils import utils
+from utils.online_migrations import OnlineMigration, parse_header
+
+SCRIPT = '''-- online: chunk_size=500 pause=0
+-- Adds the owner of each task.
+ALTER TABLE tasks ADD user_id BINARY(16),
+    ADD FOREIGN KEY (user_id) REFERENCES users(uuid) ON DELETE CASCADE;
+'''
+
+
+def test_parse_header():
+    assert parse_header(SCRIPT) == {'chunk_size': 500, 'pause': 0.0}
+    assert parse_header('-- online\nALTER TABLE tasks ADD x INT;') == {'chunk_size': 10000, 'pause': 0.05}
+    assert parse_header('ALTER TABLE tasks ADD x INT;') is None
+    with pytest.raises(ValueError):
+        parse_header('-- online: chunks=5\nALTER TABLE tasks ADD x INT;')
+
+
+def test_online_migration_takes_a_single_alter_table():
+    migration = OnlineMigration(SCRIPT, chunk_size=500, pause=0)
+    assert migration.table == 'tasks'
+    assert migration.spec.startswith('ADD user_id BINARY(16),')
+    assert migration.spec.endswith('ON DELETE CASCADE')
+
+    for script in ('-- online\nDROP TABLE tasks;', '-- online\nALTER TABLE a ADD x INT; ALTER TABLE b ADD y INT;'):
+        with pytest.raises(ValueError):
+            OnlineMigration(script, chunk_size=500, pause=0)
+
+
+def test_online_migration_triggers_copy_writes_to_the_shadow():
+    migration = OnlineMigration(SCRIPT, chunk_size=500, pause=0)
+    insert, update, delete = (
+        ' '.join(statement.split())
+        for statement in migration.trigger_statements(['uuid', 'description'], 'uuid')
+    )
+    replace = 'REPLACE INTO _tasks_new (uuid, description) VALUES (NEW.uuid, NEW.description)'
+    assert insert == f'CREATE TRIGGER _tasks_online_insert AFTER INSERT ON tasks FOR EACH ROW {replace}'
+    assert update == (
+        'CREATE TRIGGER _tasks_online_update AFTER UPDATE ON tasks FOR EACH ROW BEGIN '
+        f'DELETE FROM _tasks_new WHERE uuid = OLD.uuid; {replace}; END'
+    )
+    assert delete == (
+        'CREATE TRIGGER _tasks_online_delete AFTER DELETE ON tasks FOR EACH ROW '
+        'DELETE FROM _tasks_new WHERE uuid = OLD.uuid'
+    )
+
+
+def test_online_scripts_run_as_they_are_on_sqlite(tmp_path):
+    config_file_name = os.fspath(tmp_path / 'config.json')
+    with open(config_file_name, 'w') as file:
+        json.dump({'backend': 'sqlite', 'sqlite_path': 'tasklist.sqlite3'}, file)
+    scripts_dir = tmp_path / 'migrations'
+    scripts_dir.mkdir()
+    (scripts_dir / '0001_a.sql').write_text('CREATE TABLE things (id INTEGER PRIMARY KEY);')
+    (scripts_dir / '0002_b.sql').write_text('-- online\nALTER TABLE things ADD name VARCHAR(64);')
+
+    assert utils.run_all_scripts(os.fspath(scripts_dir), config_file_name, None) == ['0001_a', '0002_b']
+    connection = utils.get_backend(config_file_name, None).connect()
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT id, name FROM things')
+        assert cursor.fetchall() == []
+
+
+class FakeCursor:
+    '''Records the statements run, answering as MySQL would on a 5-row tasks table.'''
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.rowcount = -1
+        self._results = []
+
+    def execute(self, query, params=()):
+        query = ' '.join(query.split())
+        params = tuple(params)
+        self.connection.log.append((query, params))
+        self._results = self.connection.answer(query, params)
+        if query.startswith('INSERT IGNORE'):
+            self.rowcount = len(self._results)
+            self._results = []
+
+    def fetchone(self):
+        return self._results[0] if self._results else None
+
+    def fetchall(self):
+        return self._results
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class FakeConnection:
+    keys = [10, 20, 30, 40, 50]
+
+    def __init__(self):
+        self.log = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.log.append(('COMMIT', ()))
+
+    def answer(self, query, params):
+        if 'REFERENCED_TABLE_NAME = %s' in query:
+            return [(0, )]
+        if "CONSTRAINT_NAME = 'PRIMARY'" in query:
+            return [('uuid', )]
+        if 'REFERENTIAL_CONSTRAINTS' in query:
+            return [('tasks_ibfk_1', 'user_id', 'users', 'uuid', 'CASCADE', 'CASCADE')]
+        if 'information_schema.COLUMNS' in query:
+            columns = ['uuid', 'description', 'user_id']
+            return [(column, ) for column in columns + (['owner'] if params == ('_tasks_new', ) else [])]
+        if 'TABLE_ROWS' in query:
+            return [(len(self.keys), )]
+        if 'LIMIT 1 OFFSET' in query:
+            after, offset = params if len(params) == 2 else (None, params[0])
+            keys = [key for key in self.keys if after is None or key > after]
+            return [(keys[offset], )] if offset < len(keys) else []
+        if query.startswith('INSERT IGNORE'):
+            after = params[0] if '>' in query else None
+            until = params[-1] if '<=' in query else None
+            return [
+                (key, ) for key in self.keys
+                if (after is None or key > after) and (until is None or key <= until)
+            ]
+        return []
+
+
+def test_online_migration_run_copies_in_chunks_then_swaps():
+    messages = []
+    migration = OnlineMigration(
+        '-- online\nALTER TABLE tasks ADD owner VARCHAR(64);',
+        chunk_size=2,
+        pause=0,
+        progress=messages.append,
+    )
+    connection = FakeConnection()
+    migration.run(connection)
+
+    statements = [
+        (query, params) for query, params in connection.log
+        if 'information_schema' not in query and not query.startswith('CREATE TRIGGER')
+    ]
+    columns = 'uuid, description, user_id'
+    copy = f'INSERT IGNORE INTO _tasks_new ({columns}) SELECT {columns} FROM tasks WHERE'
+    probe = 'SELECT uuid FROM tasks WHERE'
+    probe_end = 'ORDER BY uuid LIMIT 1 OFFSET %s'
+    assert statements == [
+        # Leftovers of an interrupted run
+        ('DROP TRIGGER IF EXISTS _tasks_online_insert', ()),
+        ('DROP TRIGGER IF EXISTS _tasks_online_update', ()),
+        ('DROP TRIGGER IF EXISTS _tasks_online_delete', ()),
+        ('DROP TABLE IF EXISTS _tasks_new', ()),
+        ('CREATE TABLE _tasks_new LIKE tasks', ()),
+        (
+            'ALTER TABLE _tasks_new ADD FOREIGN KEY (user_id) REFERENCES users (uuid) '
+            'ON UPDATE CASCADE ON DELETE CASCADE',
+            (),
+        ),
+        ('ALTER TABLE _tasks_new ADD owner VARCHAR(64)', ()),
+        # Chunks of 2 keys, the last one open-ended
+        (f'{probe} TRUE {probe_end}', (1, )),
+        (f'{copy} uuid <= %s', (20, )),
+        ('COMMIT', ()),
+        (f'{probe} uuid > %s {probe_end}', (20, 1)),
+        (f'{copy} uuid > %s AND uuid <= %s', (20, 40)),
+        ('COMMIT', ()),
+        (f'{probe} uuid > %s {probe_end}', (40, 1)),
+        (f'{copy} uuid > %s', (40, )),
+        ('COMMIT', ()),
+        ('RENAME TABLE tasks TO _tasks_old, _tasks_new TO tasks', ()),
+        ('DROP TRIGGER IF EXISTS _tasks_online_insert', ()),
+        ('DROP TRIGGER IF EXISTS _tasks_online_update', ()),
+        ('DROP TRIGGER IF EXISTS _tasks_online_delete', ()),
+        ('DROP TABLE _tasks_old', ()),
+        ('COMMIT', ()),
+    ]
+
+    # The triggers are in place before the first row is copied.
+    queries = [query for query, _ in connection.log]
+    triggers = [i for i, query in enumerate(queries) if query.startswith('CREATE TRIGGER')]
+    assert len(triggers) == 3
+    assert max(triggers) < queries.index(f'{probe} TRUE {probe_end}')
+    assert f'({columns})' in queries[triggers[0]]
+
+    assert messages == [
+        'tasks: copied 2 of about 5 rows',
+        'tasks: copied 4 of about 5 rows',
+        'tasks: copied 5 of about 5 rows',
+        'tasks: swapped',
+    ]
+
+
+def test_online_migration_keeps_concurrent_writes_on_mysql(config_test_filename):
+    with open(config_test_filename, 'r') as file:
+        if json.load(file).get('backend', 'mysql') != 'mysql':
+            pytest.skip('Scripts only run online on MySQL')
+
+    backend = utils.get_backend(config_test_filename, utils.get_admin_secrets_filename())
+    connection = backend.connect()
+    backend.run_script(
+        connection,
+        'DROP TABLE IF EXISTS online_things; '
+        'CREATE TABLE online_things (id INT PRIMARY KEY, name VARCHAR(64));',
+    )
+    try:
+        expected = {i: f'thing {i}' for i in range(1000)}
+        with connection.cursor() as cursor:
+            cursor.executemany('INSERT INTO online_things (id, name) VALUES (%s, %s)', list(expected.items()))
+        connection.commit()
+
+        started = threading.Event()
+        done = threading.Event()
+        errors = []
+
+        def write():
+            # Inserts, updates and deletes rows while they are being copied.
+            rng = random.Random(0)
+            writer = backend.connect()
+            try:
+                i = len(expected)
+                while not done.is_set():
+                    updated, deleted = rng.randrange(i), rng.randrange(i)
+                    with writer.cursor() as cursor:
+                        cursor.execute('INSERT INTO online_things (id, name) VALUES (%s, %s)', (i, f'thing {i}'))
+                        cursor.execute('UPDATE online_things SET name = %s WHERE id = %s', (f'renamed {i}', updated))
+                        cursor.execute('DELETE FROM online_things WHERE id = %s', (deleted, ))
+                    writer.commit()
+                    expected[i] = f'thing {i}'
+                    if updated in expected:
+                        expected[updated] = f'renamed {i}'
+                    expected.pop(deleted, None)
+                    i += 1
+                    started.set()
+            except Exception as error:  # pylint: disable=broad-except
+                errors.append(error)
+                started.set()
+            finally:
+                writer.close()
+
+        thread = threading.Thread(target=write)
+        thread.start()
+        try:
+            started.wait()
+            OnlineMigration(
+                '-- online\nALTER TABLE online_things ADD extra INT NOT NULL DEFAULT 7;',
+                chunk_size=100,
+                pause=0.01,
+            ).run(connection)
+        finally:
+            done.set()
+            thread.join()
+        assert errors == []
+
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT id, name, extra FROM online_things ORDER BY id')
+            assert cursor.fetchall() == [(i, name, 7) for i, name in sorted(expected.items())]
+            cursor.execute(
+                'SELECT COUNT(*) FROM information_schema.TRIGGERS '
+                'WHERE TRIGGER_SCHEMA = DATABASE() AND EVENT_OBJECT_TABLE = %s',
+                ('online_things', ),
+            )
+            assert cursor.fetchone() == (0, )
+        connection.commit()
+        assert not {'_online_things_new', '_online_things_old'} & backend.table_names(connection)
+    finally:
+        backend.run_script(connection, 'DROP TABLE IF EXISTS online_things;')
+        connection.close()
@@ -0,0 +1,113 @@
+# pylint: disable=missing-module-docstring,missing-function-docstring,missing-class-docstring
+import threading
+import time
+
+import pytest
+
+from tasklist.pool import ConnectionPool, PoolClosed, PoolTimeout
+
+
+class FakeConnection:
+    def __init__(self):
+        self.alive = True
+        self.closed = False
+        self.resets = 0
+
+    def close(self):
+        self.closed = True
+
+
+def make_pool(**kwargs):
+    created = []
+
+    def connect():
+        connection = FakeConnection()
+        created.append(connection)
+        return connection
+
+    def ping(connection):
+        return connection.alive
+
+    def reset(connection):
+        if not connection.alive:
+            raise ConnectionError()
+        connection.resets += 1
+
+    return ConnectionPool(connect, ping, reset, **kwargs), created
+
+
+def test_pool_reuses_connections():
+    pool, created = make_pool(min_size=1, max_size=2)
+    assert len(created) == 1
+
+    for _ in range(10):
+        with pool.connection() as connection:
+            assert connection is created[0]
+
+    assert len(created) == 1
+    assert created[0].resets == 10
+
+
+def test_pool_is_bounded():
+    pool, created = make_pool(min_size=0, max_size=2, timeout=0.05)
+
+    first = pool.acquire()
+    second = pool.acquire()
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    assert len(created) == 2
+
+    pool.release(first)
+    assert pool.acquire() is first
+    pool.release(second)
+
+
+def test_pool_waits_for_released_connection():
+    pool, _ = make_pool(min_size=1, max_size=1, timeout=5.0)
+    connection = pool.acquire()
+
+    timer = threading.Timer(0.05, pool.release, (connection, ))
+    timer.start()
+    assert pool.acquire() is connection
+    timer.join()
+
+
+def test_pool_waits_until_the_given_deadline():
+    pool, _ = make_pool(min_size=1, max_size=1, timeout=5.0)
+    connection = pool.acquire()
+
+    # Already past: fails at once rather than after `timeout`
+    start = time.monotonic()
+    with pytest.raises(PoolTimeout):
+        pool.acquire(deadline=start)
+    assert time.monotonic() - start < 1.0
+    pool.release(connection)
+
+
+def test_pool_replaces_broken_connections():
+    pool, created = make_pool(min_size=1, max_size=1, ping_interval=0)
+
+    created[0].alive = False
+    with pool.connection() as connection:
+        assert connection is created[1]
+    assert created[0].closed
+
+    with pool.connection() as connection:
+        connection.alive = False
+    assert created[1].closed
+    assert pool.size == 0
+
+
+def test_pool_close_drains_connections():
+    pool, created = make_pool(min_size=2, max_size=3)
+    in_use = pool.acquire()
+
+    pool.close()
+    assert all(connection.closed for connection in created if connection is not in_use)
+    assert not in_use.closed
+    with pytest.raises(PoolClosed):
+        pool.acquire()
+
+    pool.release(in_use)
+    assert in_use.closed
+    assert pool.size == 0
@@ -0,0 +1,66 @@
+# pylint: disable=missing-module-docstring,missing-function-docstring
+import json
+import os.path
+
+from utils import utils
+
+from tasklist.backends import SQLiteBackend
+from tasklist.database import DBSession
+from tasklist.models import Task
+from tasklist.slow_queries import SlowQueryLog, params_shape
+
+
+def migrated_backend(tmp_path):
+    backend = SQLiteBackend(os.fspath(tmp_path / 'tasklist.sqlite3'))
+    scripts_dir = os.path.join(os.path.dirname(__file__), '..', 'database', 'migrations')
+    connection = backend.connect()
+    for filename in utils.get_script_filenames(scripts_dir, backend.name):
+        with open(os.path.join(scripts_dir, filename), 'r') as file:
+            backend.run_script(connection, file.read())
+    return backend, connection
+
+
+def test_params_shape_hides_values():
+    assert params_shape(None) is None
+    assert params_shape(('secret', b'1234', 3, None, True)) == ['str[6]', 'bytes[4]', 'int', 'null', 'bool']
+    assert params_shape([('a', 1), ('b', 2)], many=True) == {'rows': 2, 'row': ['str[1]', 'int']}
+
+
+def test_slow_statements_are_logged_with_their_plan(tmp_path):
+    backend, connection = migrated_backend(tmp_path)
+    path = os.fspath(tmp_path / 'slow_queries.log')
+    slow_queries = SlowQueryLog(0.0, backend, path=path)
+    try:
+        db = DBSession(connection, slow_queries=slow_queries)
+        db.create_task(Task(description='foo'))
+        db.commit()
+        db.read_tasks(completed=True)
+        slow_queries.flush()
+
+        entry = slow_queries.recent(1)[0]
+        assert entry['statement'] == 'read_tasks'
+        assert 'FROM tasks' in entry['query']
+        assert entry['params'] == ['bool']
+        assert entry['rows'] == 0
+        assert entry['explain']
+        assert 'create_task' in [entry['statement'] for entry in slow_queries.recent()]
+
+        with open(path, 'r') as file:
+            logged = [json.loads(line) for line in file]
+        assert logged[-1] == entry
+    finally:
+        slow_queries.close()
+        connection.close()
+
+
+def test_fast_statements_are_not_logged(tmp_path):
+    backend, connection = migrated_backend(tmp_path)
+    slow_queries = SlowQueryLog(60.0, backend)
+    try:
+        db = DBSession(connection, slow_queries=slow_queries)
+        db.read_tasks()
+        slow_queries.flush()
+        assert slow_queries.recent() == []
+    finally:
+        slow_queries.close()
+        connection.close()
@@ -0,0 +1,239 @@
+# pylint:disable=missing-module-docstring, missing-function-docstring
+import re
+import time
+
+# First line of a script to run online, e.g. `-- online: chunk_size=5000 pause=0.1`
+HEADER = re.compile(r'--\s*online\b:?(?P<options>.*)')
+ALTER_TABLE = re.compile(
+    r'ALTER\s+TABLE\s+`?(?P<table>\w+)`?\s+(?P<spec>.+?)\s*;?\s*',
+    re.IGNORECASE | re.DOTALL,
+)
+
+DEFAULT_OPTIONS = {
+    'chunk_size': 10000,
+    'pause': 0.05,
+}
+
+
+def parse_header(script: str):
+    '''Options of an online script, or None if `script` is not one.'''
+    match = HEADER.fullmatch(script.lstrip().split('\n', 1)[0].strip())
+    if match is None:
+        return None
+    options = dict(DEFAULT_OPTIONS)
+    for option in match.group('options').split():
+        name, _, value = option.partition('=')
+        if name not in DEFAULT_OPTIONS:
+            raise ValueError(f'Unknown online migration option: {name}')
+        options[name] = type(DEFAULT_OPTIONS[name])(value)
+    return options
+
+
+def _strip_comments(script: str):
+    return '\n'.join(
+        line for line in script.split('\n')
+        if not line.strip().startswith('--')
+    ).strip()
+
+
+class OnlineMigration:
+    '''Runs an ALTER TABLE on MySQL without locking the table for its duration.
+
+    The change is made on an empty shadow copy of the table, kept in sync
+    with the original by triggers while the existing rows are copied over
+    in primary-key chunks of `chunk_size` rows, each committed on its own
+    and followed by a `pause` to leave room to the service. The shadow then
+    atomically takes the table's place with RENAME TABLE.
+    Only tables with a single-column primary key, which no foreign key
+    references, can be migrated this way.
+    '''
+
+    def __init__(self, script: str, chunk_size: int, pause: float, progress=None):
+        match = ALTER_TABLE.fullmatch(_strip_comments(script))
+        if match is None or ';' in match.group('spec'):
+            raise ValueError('An online migration must be a single ALTER TABLE statement')
+        self.table = match.group('table')
+        self.spec = match.group('spec')
+        self.chunk_size = chunk_size
+        self.pause = pause
+        self.progress = progress or (lambda message: None)
+        self.shadow = f'_{self.table}_new'
+        self.old = f'_{self.table}_old'
+        self.triggers = {
+            event: f'_{self.table}_online_{event.lower()}'
+            for event in ('INSERT', 'UPDATE', 'DELETE')
+        }
+
+    def run(self, conn):
+        with conn.cursor() as cursor:
+            self._drop_leftovers(cursor)
+            self._check_not_referenced(cursor)
+            primary_key = self._primary_key(cursor)
+
+            cursor.execute(f'CREATE TABLE {self.shadow} LIKE {self.table}')
+            # CREATE TABLE ... LIKE leaves foreign keys behind.
+            for foreign_key in self._foreign_keys(cursor):
+                cursor.execute(f'ALTER TABLE {self.shadow} ADD {foreign_key}')
+            cursor.execute(f'ALTER TABLE {self.shadow} {self.spec}')
+
+            shadow_columns = self._columns(cursor, self.shadow)
+            columns = [
+                column for column in self._columns(cursor, self.table)
+                if column in shadow_columns
+            ]
+            for statement in self.trigger_statements(columns, primary_key):
+                cursor.execute(statement)
+
+            self._backfill(conn, cursor, columns, primary_key)
+
+            cursor.execute(
+                f'RENAME TABLE {self.table} TO {self.old}, {self.shadow} TO {self.table}'
+            )
+            for trigger in self.triggers.values():
+                cursor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+            cursor.execute(f'DROP TABLE {self.old}')
+        conn.commit()
+        self.progress(f'{self.table}: swapped')
+
+    def trigger_statements(self, columns, primary_key):
+        '''CREATE TRIGGER statements copying every write on the table to the shadow.'''
+        column_list = ', '.join(columns)
+        new_values = ', '.join(f'NEW.{column}' for column in columns)
+        replace = f'REPLACE INTO {self.shadow} ({column_list}) VALUES ({new_values})'
+        delete = f'DELETE FROM {self.shadow} WHERE {primary_key} = OLD.{primary_key}'
+        return [
+            f'''
+            CREATE TRIGGER {self.triggers["INSERT"]} AFTER INSERT ON {self.table}
+            FOR EACH ROW {replace}
+            ''',
+            # The primary key itself may have changed
+            f'''
+            CREATE TRIGGER {self.triggers["UPDATE"]} AFTER UPDATE ON {self.table}
+            FOR EACH ROW BEGIN {delete}; {replace}; END
+            ''',
+            f'''
+            CREATE TRIGGER {self.triggers["DELETE"]} AFTER DELETE ON {self.table}
+            FOR EACH ROW {delete}
+            ''',
+        ]
+
+    def _backfill(self, conn, cursor, columns, primary_key):
+        column_list = ', '.join(columns)
+        cursor.execute(
+            '''
+            SELECT TABLE_ROWS FROM information_schema.TABLES
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+            ''',
+            (self.table, ),
+        )
+        estimate = cursor.fetchone()[0] or 0
+
+        copied = 0
+        after = None
+        while True:
+            conditions = []
+            params = []
+            if after is not None:
+                conditions.append(f'{primary_key} > %s')
+                params.append(after)
+
+            # The last key of this chunk bounds the range to copy.
+            cursor.execute(
+                f'SELECT {primary_key} FROM {self.table} WHERE '
+                + ' AND '.join(conditions or ['TRUE'])
+                + f' ORDER BY {primary_key} LIMIT 1 OFFSET %s',
+                (*params, self.chunk_size - 1),
+            )
+            result = cursor.fetchone()
+            if result is not None:
+                conditions.append(f'{primary_key} <= %s')
+                params.append(result[0])
+
+            # Rows the triggers already copied are newer: keep them.
+            cursor.execute(
+                f'INSERT IGNORE INTO {self.shadow} ({column_list}) '
+                f'SELECT {column_list} FROM {self.table} WHERE '
+                + ' AND '.join(conditions or ['TRUE']),
+                params,
+            )
+            copied += cursor.rowcount
+            conn.commit()
+            self.progress(f'{self.table}: copied {copied} of about {estimate} rows')
+
+            if result is None:
+                return
+            after = result[0]
+            time.sleep(self.pause)
+
+    def _drop_leftovers(self, cursor):
+        # Of a run that was interrupted before the swap
+        for trigger in self.triggers.values():
+            cursor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        cursor.execute(f'DROP TABLE IF EXISTS {self.shadow}')
+
+    def _check_not_referenced(self, cursor):
+        cursor.execute(
+            '''
+            SELECT COUNT(*) FROM information_schema.KEY_COLUMN_USAGE
+            WHERE REFERENCED_TABLE_SCHEMA = DATABASE() AND REFERENCED_TABLE_NAME = %s
+            ''',
+            (self.table, ),
+        )
+        if cursor.fetchone()[0]:
+            raise ValueError(f'{self.table} is referenced by foreign keys, it cannot be swapped')
+
+    def _primary_key(self, cursor):
+        cursor.execute(
+            '''
+            SELECT COLUMN_NAME FROM information_schema.KEY_COLUMN_USAGE
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND CONSTRAINT_NAME = 'PRIMARY'
+            ''',
+            (self.table, ),
+        )
+        columns = [column for column, in cursor.fetchall()]
+        if len(columns) != 1:
+            raise ValueError(f'{self.table} needs a single-column primary key')
+        return columns[0]
+
+    def _foreign_keys(self, cursor):
+        cursor.execute(
+            '''
+            SELECT k.CONSTRAINT_NAME, k.COLUMN_NAME, k.REFERENCED_TABLE_NAME,
+                k.REFERENCED_COLUMN_NAME, r.UPDATE_RULE, r.DELETE_RULE
+            FROM information_schema.KEY_COLUMN_USAGE k
+            JOIN information_schema.REFERENTIAL_CONSTRAINTS r
+                ON r.CONSTRAINT_SCHEMA = k.CONSTRAINT_SCHEMA
+                AND r.CONSTRAINT_NAME = k.CONSTRAINT_NAME
+            WHERE k.TABLE_SCHEMA = DATABASE() AND k.TABLE_NAME = %s
+            ORDER BY k.CONSTRAINT_NAME, k.ORDINAL_POSITION
+            ''',
+            (self.table, ),
+        )
+        constraints = {}
+        for name, column, referenced_table, referenced_column, on_update, on_delete in cursor.fetchall():
+            constraint = constraints.setdefault(
+                name,
+                {'columns': [], 'table': referenced_table, 'referenced': [],
+                 'on_update': on_update, 'on_delete': on_delete},
+            )
+            constraint['columns'].append(column)
+            constraint['referenced'].append(referenced_column)
+        # Left unnamed, so that RENAME TABLE gives them the table's name.
+        return [
+            f'FOREIGN KEY ({", ".join(constraint["columns"])}) '
+            f'REFERENCES {constraint["table"]} ({", ".join(constraint["referenced"])}) '
+            f'ON UPDATE {constraint["on_update"]} ON DELETE {constraint["on_delete"]}'
+            for constraint in constraints.values()
+        ]
+
+    @staticmethod
+    def _columns(cursor, table):
+        cursor.execute(
+            '''
+            SELECT COLUMN_NAME FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+            ORDER BY ORDINAL_POSITION
+            ''',
+            (table, ),
+        )
+        return [column for column, in cursor.fetchall()]
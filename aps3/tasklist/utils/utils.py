@@ -3,7 +3,7 @@ import json
 import os
 import os.path
 
-import mysql.connector as cnt
+from .online_migrations import OnlineMigration, parse_header
 
 
 def get_config_filename():
@@ -42,39 +42,119 @@ def get_admin_secrets_filename():
     )
 
 
-def run_script(filename_script, filename_config, filename_secrets):
-    with open(filename_script, 'r') as file:
-        script = file.read()
+def get_backend(filename_config, filename_secrets):
+    # Imported here so the tasklist package (and its dependencies) is only
+    # needed when scripts are actually run.
+    from tasklist.backends import get_backend_credentials, make_backend  # pylint: disable=import-outside-toplevel
+
     with open(filename_config, 'r') as file:
         config = json.load(file)
-    with open(filename_secrets, 'r') as file:
-        secrets = json.load(file)
-    conn = cnt.connect(
-        host=config['db_host'],
-        database=config['database'],
-        user=secrets['user'],
-        password=secrets['password'],
+    return make_backend(
+        get_backend_credentials(config, filename_config, filename_secrets)
+    )
+
+
+def _run_script_file(backend, conn, filename_script, progress=None):
+    '''Runs a script, online if it starts with an `-- online` header.
+
+    Online scripts are only run online on MySQL. SQLite runs them as they
+    are: there, adding a column only rewrites the schema, not the rows.
+    '''
+    with open(filename_script, 'r') as file:
+        script = file.read()
+    options = parse_header(script)
+    if options is not None and backend.name == 'mysql':
+        OnlineMigration(script, progress=progress, **options).run(conn)
+    else:
+        backend.run_script(conn, script)
+
+
+def run_script(filename_script, filename_config, filename_secrets, progress=None):
+    backend = get_backend(filename_config, filename_secrets)
+    conn = backend.connect()
+    try:
+        _run_script_file(backend, conn, filename_script, progress)
+    finally:
+        conn.close()
+
+
+def get_script_filenames(scripts_dir, backend_name):
+    '''Sorted scripts to run on `backend_name`.
+
+    A script named `NNNN_name.<backend>.sql` replaces `NNNN_name.sql` on that
+    backend and is skipped on the others.
+    '''
+    scripts = {}
+    for filename in os.listdir(scripts_dir):
+        if not filename.endswith('.sql'):
+            continue
+        parts = filename[:-len('.sql')].split('.')
+        if len(parts) == 1:
+            scripts.setdefault(parts[0], filename)
+        elif parts[1] == backend_name:
+            scripts[parts[0]] = filename
+    return [scripts[name] for name in sorted(scripts)]
+
+
+def get_script_name(filename):
+    '''`NNNN_name`, whichever backend the script `filename` is for.'''
+    return filename.split('.')[0]
+
+
+def get_applied_scripts(backend, conn):
+    '''Names of the scripts already run, from the schema_migrations table.'''
+    backend.run_script(
+        conn,
+        '''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            name VARCHAR(255) PRIMARY KEY,
+            applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+        ''',
     )
     with conn.cursor() as cursor:
-        # One has to iterate through the results to get them executed properly
-        # when using multi=True in this library. Makes sense after reflecting
-        # on it: each cursor has to be exhausted before emitting another
-        # command. Docs are not that clear, though:
-        # https://dev.mysql.com/doc/connector-python/en/connector-python-api-mysqlcursor-execute.html
-        for _ in cursor.execute(script, multi=True):
-            pass
+        cursor.execute('SELECT name FROM schema_migrations')
+        return {name for name, in cursor.fetchall()}
+
+
+def _mark_applied(conn, name):
+    with conn.cursor() as cursor:
+        cursor.execute('INSERT INTO schema_migrations (name) VALUES (%s)', (name, ))
     conn.commit()
-    conn.close()
-
-
-def run_all_scripts(scripts_dir, filename_config, filename_secrets):
-    filenames = sorted([
-        filename for filename in os.listdir(scripts_dir)
-        if filename.endswith('.sql')
-    ])
-    for filename in filenames:
-        run_script(
-            os.path.join(scripts_dir, filename),
-            filename_config,
-            filename_secrets,
-        )
+
+
+def run_all_scripts(scripts_dir, filename_config, filename_secrets, baseline=None, progress=None):
+    '''Runs the scripts in `scripts_dir` not applied yet, in order, on one connection.
+
+    Each script is recorded in schema_migrations once it ran. Scripts up
+    to `baseline` included are only recorded, not run: that is how a
+    database migrated before migrations were tracked is brought in. Such a
+    database, with tables but no schema_migrations, is refused without a
+    `baseline`, rather than migrated again from scratch.
+    `progress` is called with messages about online scripts (see
+    online_migrations). Returns the names of the scripts run.
+    '''
+    backend = get_backend(filename_config, filename_secrets)
+    conn = backend.connect()
+    try:
+        tables = backend.table_names(conn)
+        if baseline is None and tables and 'schema_migrations' not in tables:
+            raise ValueError(
+                'The database has tables but no schema_migrations: pass the last '
+                'migration it went through as baseline to start tracking them'
+            )
+        applied = get_applied_scripts(backend, conn)
+        run = []
+        for filename in get_script_filenames(scripts_dir, backend.name):
+            name = get_script_name(filename)
+            if name in applied:
+                continue
+            if baseline is None or name > baseline:
+                _run_script_file(backend, conn, os.path.join(scripts_dir, filename), progress)
+                run.append(name)
+            # Not atomic with the script on MySQL, where DDL commits on its
+            # own: a script that failed halfway has to be fixed by hand.
+            _mark_applied(conn, name)
+        return run
+    finally:
+        conn.close()